@@ -0,0 +1,196 @@
+# lde_bench.py
+import os, sys, time, zlib, tempfile
+from multiprocessing import get_context
+import mvp_core as core
+
+MB = 1024 * 1024
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return -1.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux/Android, bytes on macOS
+    return rss / MB if sys.platform == "darwin" else rss / 1024
+
+def _make_file(size_mb, line_len=80):
+    fd, path = tempfile.mkstemp(prefix="lde_bench_", suffix=".txt")
+    line = (b"x" * (line_len - 1)) + b"\n"
+    block = line * max(1, MB // line_len)
+    with os.fdopen(fd, "wb") as f:
+        left = size_mb * MB
+        while left > 0:
+            f.write(block[:left])
+            left -= len(block)
+    return path
+
+def _fps_reader_child(args):
+    reader, path, chunk_size, work = args
+    core.IO_THROTTLE = False  # measure the readers, not the tier's rate limit
+    t0 = time.perf_counter()
+    seen = 0
+    for chunk in core.FPS_READERS[reader](path, chunk_size):
+        if work == "scan":
+            zlib.crc32(chunk)  # touch every byte at C speed
+        else:
+            core.process_chunk(chunk)
+        seen += len(chunk)
+    return seen, time.perf_counter() - t0, _peak_rss_mb()
+
+def bench_fps_readers(size_mb=64, chunk_size=64 * 1024):
+    """MB/s and peak RSS per FPS reader, each run in a fresh process."""
+    size_mb, chunk_size = int(size_mb), int(chunk_size)
+    path = _make_file(size_mb)
+    ctx = get_context("spawn")
+    print(f"=== FPS readers: {size_mb} MB file, {chunk_size} B chunks ===")
+    try:
+        for work in ("scan", "process"):
+            for reader in core.FPS_READERS:
+                with ctx.Pool(1) as pool:
+                    seen, dt, rss = pool.apply(_fps_reader_child, ((reader, path, chunk_size, work),))
+                print(f"{work:8s} {reader:9s} {seen / MB / max(dt, 1e-9):9.1f} MB/s  peak RSS {rss:7.1f} MB")
+        print("note: mapped file pages count toward RSS but are reclaimable page cache")
+    finally:
+        os.remove(path)
+
+def _time_best(fn, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def bench_kernels(chunk_kb=256, rounds=5):
+    """Pure-Python vs NumPy time per chunk kernel; also checks both agree."""
+    chunk_kb, rounds = int(chunk_kb), int(rounds)
+    line = b"lorem ipsum dolor sit amet " * 3 + b"\n"
+    buf = memoryview((line * (chunk_kb * 1024 // len(line) + 1))[:chunk_kb * 1024])
+    mb = len(buf) / MB
+    print(f"=== Chunk kernels: {chunk_kb} KB chunk, best of {rounds} ===")
+    if core.np is None:
+        print("numpy not installed: timing the pure-Python fallbacks only")
+    for name in core.CHUNK_KERNELS:
+        py = core.run_kernels([name], buf, backend="python")[name]
+        t_py = _time_best(lambda: core.run_kernels([name], buf, backend="python"), rounds)
+        row = f"{name:12s} python {mb / t_py:9.1f} MB/s"
+        if core.np is not None:
+            vec = core.run_kernels([name], buf, backend="numpy")[name]
+            if vec != py:
+                raise AssertionError(f"{name}: numpy result differs from python fallback")
+            t_np = _time_best(lambda: core.run_kernels([name], buf, backend="numpy"), rounds)
+            row += f"  numpy {mb / t_np:9.1f} MB/s  x{t_py / t_np:.1f}"
+        print(row)
+
+def bench_heavy(units=1000000, scalar_sample=2000):
+    """Per-unit cost of heavy_compute: scalar loop vs closed form vs batch engine."""
+    units, scalar_sample = int(units), int(scalar_sample)
+    sample = list(range(-scalar_sample // 2, scalar_sample // 2))
+    ref = [core.heavy_compute(x) for x in sample]
+    if [core.heavy_compute_fast(x) for x in sample] != ref:
+        raise AssertionError("heavy_compute_fast differs from heavy_compute")
+    backends = ["python"] + (["numpy"] if core.np is not None else [])
+    for b in backends:
+        if [int(v) for v in core.heavy_compute_batch(sample, backend=b)] != ref:
+            raise AssertionError(f"heavy_compute_batch ({b}) differs from heavy_compute")
+    print(f"=== heavy_compute: results match on {len(sample)} inputs ===")
+    t_loop = _time_best(lambda: [core.heavy_compute(x) for x in sample], 1) / len(sample)
+    print(f"scalar loop   {t_loop * 1e6:10.3f} us/unit")
+    xs = list(range(1, units + 1))
+    t_fast = _time_best(lambda: [core.heavy_compute_fast(x) for x in xs], 3) / units
+    print(f"closed form   {t_fast * 1e6:10.3f} us/unit  x{t_loop / t_fast:.0f}")
+    for b in backends:
+        arr = core.np.arange(1, units + 1, dtype=core.np.int64) if b == "numpy" else xs
+        t = _time_best(lambda: core.heavy_compute_batch(arr, backend=b), 3) / units
+        print(f"batch {b:7s} {t * 1e6:10.3f} us/unit  x{t_loop / t:.0f}")
+
+def bench_shm(max_exp=7, workers=None):
+    """pool.map(heavy_compute_fast) vs shared-memory index ranges, 1e4..1e<max_exp> units."""
+    max_exp = int(max_exp)
+    workers = int(workers) if workers else os.cpu_count() or 1
+    print(f"=== DPS IPC: pool.map vs shared memory, {workers} workers ===")
+    with get_context("fork" if sys.platform != "win32" else "spawn").Pool(workers) as pool:
+        for e in range(4, max_exp + 1):
+            n = 10 ** e
+            xs = list(range(1, n + 1))
+            t0 = time.perf_counter()
+            ref = pool.map(core.heavy_compute_fast, xs)
+            t_map = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            out = core.shared_map(pool, core.heavy_compute_batch, xs)
+            t_shm = time.perf_counter() - t0
+            if [int(v) for v in out[:1000]] != ref[:1000] or int(out[-1]) != ref[-1]:
+                raise AssertionError("shared-memory results differ from pool.map")
+            print(f"1e{e:<2d} pool.map {n / t_map:12.0f} units/s  shared {n / t_shm:12.0f} units/s  x{t_map / t_shm:.1f}")
+
+def bench_quota(checks=200000, *account_counts):
+    """Per-account message-quota checks per second at 100k and 1M accounts."""
+    import random
+    import lde_quota
+    checks = int(checks)
+    counts = [int(n) for n in account_counts] or [100000, 1000000]
+    print(f"=== Quota store: {checks} checks, LRU of {lde_quota.QUOTA_HOT_ACCOUNTS} hot accounts ===")
+    for n in counts:
+        fd, path = tempfile.mkstemp(prefix="lde_quota_", suffix=".sqlite")
+        os.close(fd)
+        try:
+            store = lde_quota.QuotaStore(path)
+            t0 = time.perf_counter()
+            store.bulk_create(f"acct{i}" for i in range(n))
+            print(f"{n:8d} accounts created in {time.perf_counter() - t0:.2f}s")
+            rng = random.Random(1)
+            hot = max(1, min(n, lde_quota.QUOTA_HOT_ACCOUNTS) // 2)
+            workloads = {
+                "skewed": [f"acct{rng.randrange(hot) if rng.random() < 0.9 else rng.randrange(n)}" for _ in range(checks)],
+                "uniform": [f"acct{rng.randrange(n)}" for _ in range(checks)],
+            }
+            for name, ids in workloads.items():
+                store.stats.update(hits=0, loads=0, creates=0)
+                t0 = time.perf_counter()
+                for a in ids:
+                    store.increment_messages_used(a)
+                dt = time.perf_counter() - t0
+                print(f"{n:8d} {name:8s} {checks / dt:12.0f} checks/s  LRU hit ratio {store.hit_ratio()}")
+            store.close()
+        finally:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+def bench_meter(clients=50, requests=200, accounts=0):
+    """Metering service requests/sec and p50/p99 latency (forked server on localhost)."""
+    import lde_meter
+    print(f"=== Meter service: {int(clients)} clients x {int(requests)} requests ===")
+    for label, unix_path in (("tcp", None), ("unix", os.path.join(tempfile.gettempdir(), "lde_meter_bench.sock"))):
+        if unix_path and not hasattr(__import__("socket"), "AF_UNIX"):
+            continue
+        r = lde_meter.run_load_bench(int(clients), int(requests), int(accounts), unix_path)
+        print(f"{label:5s} {r['rps']:10.1f} req/s  p50 {r['p50_ms']:7.3f} ms  p99 {r['p99_ms']:7.3f} ms  "
+              f"({r['server']['batches']} batches, {r['server']['coalesced']} coalesced)")
+
+def bench_cluster(units=4000, *worker_counts):
+    """Localhost coordinator/worker throughput as workers are added."""
+    import lde_cluster
+    counts = tuple(int(n) for n in worker_counts) or (1, 2, 4)
+    print(f"=== DPS cluster: {int(units)} units, workers {counts} (cpu_count={os.cpu_count()}) ===")
+    lde_cluster.scaling_report(counts, units=int(units))
+
+BENCHES = {
+    "fps_readers": bench_fps_readers,
+    "kernels": bench_kernels,
+    "heavy": bench_heavy,
+    "shm": bench_shm,
+    "quota": bench_quota,
+    "meter": bench_meter,
+    "cluster": bench_cluster,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:2] or list(BENCHES)
+    extra = sys.argv[2:]
+    for name in names:
+        if name not in BENCHES:
+            print(f"Unknown benchmark: {name}. Choose from: {', '.join(BENCHES)}")
+            sys.exit(2)
+        BENCHES[name](*extra)
@@ -0,0 +1,347 @@
+# lde_cluster.py
+# Multi-node DPS: a TCP coordinator hands out heavy_compute-style task batches
+# to worker processes (same machine or others), with heartbeats, retries of
+# lost tasks and work stealing between worker queues.
+#
+# Protocol: one JSON object per line, each request answered by one reply.
+#   {"op": "register", "name": str}                 -> {"worker_id", "heartbeat_s"}
+#   {"op": "pull", "worker_id": id, "max": n}       -> {"tasks": [[task_id, kernel, payload], ...],
+#                                                       "wait": seconds} | {"tasks": [], "done": true}
+#   {"op": "result", "worker_id": id, "results": [[task_id, value], ...]} -> {"ok": true}
+#   {"op": "heartbeat", "worker_id": id}            -> {"ok": true}
+import json, os, sys, time, socket, threading, socketserver
+from collections import deque
+from multiprocessing import Process
+import mvp_core as core
+
+# Kernels are looked up by name on the worker; code never travels over the wire
+CLUSTER_KERNELS = {
+    "heavy_compute": lambda xs: [core.heavy_compute(x) for x in xs],
+    "heavy_block": lambda b: [int(v) for v in core.heavy_compute_batch(range(b[0], b[1]))],
+}
+
+HEARTBEAT_S = 1.0
+HEARTBEAT_TIMEOUT_S = 4.0
+MAX_RETRIES = 3
+
+class Coordinator:
+    """Task queues and leases for one cluster; serve() exposes it over TCP.
+
+    Submitted tasks are dealt round-robin onto per-worker queues. A worker
+    pulls from its own queue first, then the shared queue, then steals from
+    the back of the longest other queue. Tasks held by a worker that stops
+    heartbeating go back on the shared queue, up to MAX_RETRIES times.
+    """
+    def __init__(self, host="127.0.0.1", port=0, heartbeat_timeout=HEARTBEAT_TIMEOUT_S,
+                 max_retries=MAX_RETRIES):
+        self.host, self.port = host, port
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_retries = max_retries
+        self.lock = threading.Condition()
+        self.workers = {}       # worker_id -> {"name", "seen", "queue": deque, "done": int}
+        self.shared = deque()
+        self.leases = {}        # task_id -> worker_id
+        self.tasks = {}         # task_id -> [kernel, payload, retries]
+        self.results = {}       # task_id -> value
+        self.failed = set()
+        self.stats = {"stolen": 0, "retried": 0, "lost_workers": 0}
+        self._next_worker = 0
+        self._rr = 0
+        self._server = None
+        self._closing = False
+
+    # --- coordinator-side API ---
+    def submit(self, kernel, payloads):
+        """Queue one task per payload; returns their task ids in order."""
+        if kernel not in CLUSTER_KERNELS:
+            raise ValueError(f"Unknown cluster kernel: {kernel}")
+        with self.lock:
+            ids = []
+            for payload in payloads:
+                tid = len(self.tasks)
+                self.tasks[tid] = [kernel, payload, 0]
+                self._deal(tid)
+                ids.append(tid)
+            self.lock.notify_all()
+            return ids
+
+    def wait(self, task_ids, timeout=None):
+        """Results for task_ids in order; raises if any task failed for good."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while True:
+                bad = [t for t in task_ids if t in self.failed]
+                if bad:
+                    raise RuntimeError(f"{len(bad)} task(s) failed after {self.max_retries} retries")
+                if all(t in self.results for t in task_ids):
+                    return [self.results[t] for t in task_ids]
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    raise TimeoutError("cluster tasks did not finish in time")
+                self.lock.wait(0.2 if left is None else min(0.2, left))
+
+    def wait_workers(self, n, timeout=30):
+        """Block until n workers have registered."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while len(self.workers) < n:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise TimeoutError(f"only {len(self.workers)} of {n} workers registered")
+                self.lock.wait(min(0.2, left))
+
+    def serve(self):
+        """Start the TCP server and the lease reaper in background threads."""
+        coord = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        reply = coord.handle(json.loads(line))
+                    except Exception as e:
+                        reply = {"error": str(e)}
+                    self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._reaper, daemon=True).start()
+        return self.host, self.port
+
+    def close(self):
+        """Tell workers to exit on their next pull, then stop the server."""
+        with self.lock:
+            self._closing = True
+        if self._server:
+            time.sleep(2 * HEARTBEAT_S)  # let idle workers see "done"
+            self._server.shutdown()
+            self._server.server_close()
+
+    # --- protocol ---
+    def handle(self, msg):
+        op = msg.get("op")
+        with self.lock:
+            if op == "register":
+                wid = self._next_worker
+                self._next_worker += 1
+                self.workers[wid] = {"name": msg.get("name", f"w{wid}"), "seen": time.monotonic(),
+                                     "queue": deque(), "done": 0}
+                self.lock.notify_all()
+                return {"worker_id": wid, "heartbeat_s": HEARTBEAT_S}
+            w = self.workers.get(msg.get("worker_id"))
+            if w is None:
+                return {"error": "unknown or expired worker"}
+            w["seen"] = time.monotonic()
+            if op == "heartbeat":
+                return {"ok": True}
+            if op == "pull":
+                return self._pull(msg["worker_id"], int(msg.get("max", 1)))
+            if op == "result":
+                for tid, value in msg.get("results", []):
+                    if self.leases.get(tid) == msg["worker_id"]:
+                        del self.leases[tid]
+                    if tid not in self.results and tid not in self.failed:
+                        self.results[tid] = value
+                        w["done"] += 1
+                self.lock.notify_all()
+                return {"ok": True}
+        return {"error": f"unknown op: {op}"}
+
+    def _deal(self, tid):
+        live = sorted(self.workers)
+        if not live:
+            self.shared.append(tid)
+            return
+        self.workers[live[self._rr % len(live)]]["queue"].append(tid)
+        self._rr += 1
+
+    def _pull(self, wid, n):
+        mine = self.workers[wid]["queue"]
+        out = []
+        while len(out) < n:
+            if mine:
+                tid = mine.popleft()
+            elif self.shared:
+                tid = self.shared.popleft()
+            else:
+                victim = max((w["queue"] for k, w in self.workers.items() if k != wid),
+                             key=len, default=None)
+                if not victim:
+                    break
+                tid = victim.pop()  # steal from the back, the owner works from the front
+                self.stats["stolen"] += 1
+            if tid in self.results or tid in self.failed:
+                continue
+            self.leases[tid] = wid
+            kernel, payload, _ = self.tasks[tid]
+            out.append([tid, kernel, payload])
+        if out:
+            return {"tasks": out}
+        if self._closing:
+            return {"tasks": [], "done": True}
+        return {"tasks": [], "wait": 0.05}
+
+    def _reaper(self):
+        while True:
+            time.sleep(self.heartbeat_timeout / 4)
+            now = time.monotonic()
+            with self.lock:
+                dead = [k for k, w in self.workers.items() if now - w["seen"] > self.heartbeat_timeout]
+                for wid in dead:
+                    w = self.workers.pop(wid)
+                    self.stats["lost_workers"] += 1
+                    self.shared.extend(w["queue"])
+                    for tid in [t for t, owner in self.leases.items() if owner == wid]:
+                        del self.leases[tid]
+                        task = self.tasks[tid]
+                        task[2] += 1
+                        if task[2] > self.max_retries:
+                            self.failed.add(tid)
+                        else:
+                            self.stats["retried"] += 1
+                            self.shared.append(tid)
+                if dead:
+                    self.lock.notify_all()
+
+    def worker_stats(self):
+        with self.lock:
+            return {w["name"]: w["done"] for w in self.workers.values()}
+
+class _Conn:
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.rfile = self.sock.makefile("rb")
+        self.lock = threading.Lock()
+
+    def call(self, msg):
+        with self.lock:
+            self.sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+            line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("coordinator closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+def run_worker(host, port, name=None, batch=1, fail_after=None):
+    """Pull, compute and return tasks until the coordinator says done.
+
+    fail_after=N makes the worker vanish while holding its Nth batch
+    (used to exercise retries).
+    """
+    conn = _Conn(host, port)
+    reg = conn.call({"op": "register", "name": name or f"{socket.gethostname()}:{os.getpid()}"})
+    wid = reg["worker_id"]
+    stop = threading.Event()
+
+    def beat():
+        hb = _Conn(host, port)
+        try:
+            while not stop.wait(reg["heartbeat_s"]):
+                hb.call({"op": "heartbeat", "worker_id": wid})
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            hb.close()
+
+    threading.Thread(target=beat, daemon=True).start()
+    pulled = 0
+    try:
+        while True:
+            reply = conn.call({"op": "pull", "worker_id": wid, "max": batch})
+            if reply.get("done") or reply.get("error"):
+                return
+            if not reply["tasks"]:
+                time.sleep(reply.get("wait", 0.05))
+                continue
+            pulled += 1
+            if fail_after is not None and pulled >= fail_after:
+                os._exit(1)
+            results = [[tid, CLUSTER_KERNELS[k](payload)] for tid, k, payload in reply["tasks"]]
+            conn.call({"op": "result", "worker_id": wid, "results": results})
+    except (OSError, ConnectionError):
+        return
+    finally:
+        stop.set()
+        conn.close()
+
+def run_local_cluster(n_workers=2, units=4000, batch_units=100, kernel="heavy_compute", fail_one=False):
+    """Run a localhost cluster with n worker processes; returns throughput stats.
+
+    Results are checked against the local kernel. fail_one=True kills one
+    worker mid-run to show its tasks being retried elsewhere.
+    """
+    coord = Coordinator()
+    host, port = coord.serve()
+    if kernel == "heavy_compute":
+        payloads = [list(range(a, min(a + batch_units, units + 1))) for a in range(1, units + 1, batch_units)]
+    else:
+        payloads = [[a, min(a + batch_units, units + 1)] for a in range(1, units + 1, batch_units)]
+    procs = []
+    for i in range(n_workers):
+        fail = 2 if fail_one and i == 0 else None
+        p = Process(target=run_worker, args=(host, port, f"worker-{i}", 1, fail), daemon=True)
+        p.start()
+        procs.append(p)
+    try:
+        coord.wait_workers(n_workers)
+        t0 = time.perf_counter()
+        ids = coord.submit(kernel, payloads)
+        parts = coord.wait(ids, timeout=600)
+        secs = time.perf_counter() - t0  # before teardown: close() waits for idle workers
+    finally:
+        coord.close()
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    out = [v for part in parts for v in part]
+    if out != [core.heavy_compute_fast(x) for x in range(1, units + 1)]:
+        raise AssertionError("cluster results differ from heavy_compute")
+    return {"workers": n_workers, "units": units, "seconds": round(secs, 3),
+            "units_per_s": round(units / secs, 1), **coord.stats}
+
+def scaling_report(worker_counts=(1, 2, 4), units=4000, batch_units=100):
+    """Throughput as workers are added (all on localhost)."""
+    rows, base = [], None
+    for n in worker_counts:
+        r = run_local_cluster(n, units, batch_units)
+        base = base or r["units_per_s"]
+        r["speedup"] = round(r["units_per_s"] / base, 2)
+        rows.append(r)
+        print(f"{n:3d} workers: {r['units_per_s']:10.1f} units/s  x{r['speedup']}  "
+              f"(stolen {r['stolen']}, retried {r['retried']})")
+    return rows
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    cmd = args[0] if args else "scaling"
+    if cmd == "worker":
+        # python lde_cluster.py worker HOST PORT
+        run_worker(args[1], int(args[2]))
+    elif cmd == "coordinator":
+        # python lde_cluster.py coordinator PORT UNITS  (workers connect from anywhere)
+        c = Coordinator(host="0.0.0.0", port=int(args[1]) if len(args) > 1 else 7070)
+        print("Coordinator listening on port", c.serve()[1])
+        n = int(args[2]) if len(args) > 2 else 10000
+        t0 = time.perf_counter()
+        ids = c.submit("heavy_compute", [list(range(a, min(a + 100, n + 1))) for a in range(1, n + 1, 100)])
+        c.wait(ids)
+        print(f"{n} units in {time.perf_counter() - t0:.2f}s; per worker: {c.worker_stats()}")
+        c.close()
+    elif cmd == "retry":
+        print(run_local_cluster(3, 2000, 50, fail_one=True))
+    else:
+        counts = tuple(int(x) for x in args[1:]) or (1, 2, 4)
+        scaling_report(counts)
@@ -0,0 +1,109 @@
+# lde_ledger.py
+# SQLite usage history: one row per day (date is the primary key, so range
+# scans use the index) plus weekly and monthly rollups kept up to date on
+# every write. Views read a bounded number of rows however much history exists.
+# Days dropped by retention stay counted in the rollups; writes for them are
+# ignored afterwards, so re-importing old history never counts a day twice.
+import sqlite3, threading
+from datetime import date, timedelta
+
+MB = 1024 * 1024
+
+def _day(d):
+    return d if isinstance(d, str) else d.isoformat()
+
+def _week_of(day):
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()  # Monday of its ISO week
+
+class UsageLedger:
+    def __init__(self, path="usage_ledger.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS daily (day TEXT PRIMARY KEY, read INTEGER NOT NULL,
+                                              written INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS weekly (week TEXT PRIMARY KEY, read INTEGER NOT NULL,
+                                               written INTEGER NOT NULL, days INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS monthly (month TEXT PRIMARY KEY, read INTEGER NOT NULL,
+                                                written INTEGER NOT NULL, days INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+        """)
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'pruned_before'").fetchone()
+        self.pruned_before = row[0] if row else ""
+
+    def set_day(self, day, read, written):
+        """Store a day's totals (replacing any earlier value); rollups move by the difference.
+
+        Days before the retention cutoff are already in the rollups and are
+        skipped; returns False for them.
+        """
+        day = _day(day)
+        if day < self.pruned_before:
+            return False
+        with self._lock, self._db:
+            row = self._db.execute("SELECT read, written FROM daily WHERE day = ?", (day,)).fetchone()
+            d_read, d_written = read - (row[0] if row else 0), written - (row[1] if row else 0)
+            new_day = 0 if row else 1
+            self._db.execute("INSERT OR REPLACE INTO daily VALUES (?, ?, ?)", (day, read, written))
+            for table, col, key in (("weekly", "week", _week_of(day)), ("monthly", "month", day[:7])):
+                self._db.execute(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, 1) ON CONFLICT({col}) DO UPDATE SET "
+                    "read = read + ?, written = written + ?, days = days + ?",
+                    (key, read, written, d_read, d_written, new_day))
+        return True
+
+    def import_history(self, hist):
+        """Load a STATE["workspace"]["daily_history"]-style dict."""
+        for day, v in hist.items():
+            self.set_day(day, int(v.get("read", 0)), int(v.get("written", 0)))
+
+    def last_days(self, n, until=None):
+        """Most recent n stored days (up to `until`), newest first: [(day, read, written)]."""
+        with self._lock:
+            if until is None:
+                q = self._db.execute("SELECT day, read, written FROM daily ORDER BY day DESC LIMIT ?", (n,))
+            else:
+                q = self._db.execute("SELECT day, read, written FROM daily WHERE day <= ? "
+                                     "ORDER BY day DESC LIMIT ?", (_day(until), n))
+            return q.fetchall()
+
+    def between(self, start, end):
+        """Days in [start, end], oldest first."""
+        with self._lock:
+            return self._db.execute("SELECT day, read, written FROM daily WHERE day BETWEEN ? AND ? "
+                                    "ORDER BY day", (_day(start), _day(end))).fetchall()
+
+    def totals(self, start, end):
+        with self._lock:
+            r, w = self._db.execute("SELECT COALESCE(SUM(read), 0), COALESCE(SUM(written), 0) FROM daily "
+                                    "WHERE day BETWEEN ? AND ?", (_day(start), _day(end))).fetchone()
+        return {"read": r, "written": w}
+
+    def weeks(self, n=4):
+        """Latest n weekly rollups, newest first: [(monday, read, written, days)]."""
+        with self._lock:
+            return self._db.execute("SELECT week, read, written, days FROM weekly "
+                                    "ORDER BY week DESC LIMIT ?", (n,)).fetchall()
+
+    def months(self, n=12):
+        """Latest n monthly rollups, newest first: [(YYYY-MM, read, written, days)]."""
+        with self._lock:
+            return self._db.execute("SELECT month, read, written, days FROM monthly "
+                                    "ORDER BY month DESC LIMIT ?", (n,)).fetchall()
+
+    def apply_retention(self, keep_days, today=None):
+        """Drop daily rows older than keep_days; weekly/monthly rollups are kept."""
+        cutoff = (date.fromisoformat(_day(today)) if today else date.today()) - timedelta(days=keep_days)
+        cutoff = max(cutoff.isoformat(), self.pruned_before)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('pruned_before', ?)", (cutoff,))
+            self.pruned_before = cutoff
+            return self._db.execute("DELETE FROM daily WHERE day < ?", (cutoff,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,320 @@
+# lde_meter.py
+# Local metering service: one process owns the mvp_core state (and, for
+# requests that name an account, an lde_quota store) and serves it over a
+# Unix socket or localhost TCP, so the UI, the CLI and other tools on the
+# host share a single consistent meter.
+#
+# Protocol: one JSON object per line; replies echo the request's "id".
+#   {"op": "ask", "style": "simple", "question": "..."}   -> {"answer"}
+#   {"op": "read" | "write", "bytes": n}                   -> {"ok": true}
+#   {"op": "set_tier", "tier": "pro"}                      -> {"ok": bool}
+#   {"op": "resources"}                                    -> {"resources", "usage"}
+#   {"op": "allowance"}                                    -> {"allowance"}  (I/O rates, budget left)
+# Any op may carry "account" to meter that account instead of the local user.
+import asyncio, json, os, shutil, socket, statistics, sys, tempfile, time
+from multiprocessing import Process
+import mvp_core as core
+
+METER_PORT = 7071
+METER_MAX_BATCH = 512   # requests taken off the queue per state update
+METER_FLUSH_S = 1.0     # persistence flush interval while requests keep coming
+_NO_QUOTA = "this meter has no account store (start it with a quota path)"
+
+class MeterServer:
+    """Single-writer meter: connections enqueue requests, one task applies them.
+
+    Each batch is whatever is queued when the applier wakes up; runs of
+    consecutive read/write requests collapse into one counter update, and
+    persistence is flushed once per METER_FLUSH_S rather than per request.
+    """
+    def __init__(self, quota_path=None):
+        self.queue = None
+        self.quota = None
+        if quota_path:
+            import lde_quota
+            self.quota = lde_quota.QuotaStore(quota_path)
+        self.stats = {"requests": 0, "batches": 0, "coalesced": 0}
+        self._dirty = False
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=METER_PORT):
+        self.queue = asyncio.Queue()
+        core.load_state()
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            server = await asyncio.start_unix_server(self._client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self._client, host, port)
+        applier = asyncio.ensure_future(self._apply_loop())
+        flusher = asyncio.ensure_future(self._flush_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            applier.cancel()
+            flusher.cancel()
+            self._flush()
+
+    async def _client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    writer.write(b'{"error": "bad json"}\n')
+                    continue
+                if not isinstance(msg, dict):
+                    writer.write(b'{"error": "request must be a JSON object"}\n')
+                    continue
+                fut = loop.create_future()
+                await self.queue.put((msg, fut))
+                reply = await fut
+                if "id" in msg:
+                    reply["id"] = msg["id"]
+                writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _apply_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < METER_MAX_BATCH and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                self._apply(batch)
+            except Exception as e:
+                # never let one batch stop the applier; whoever is still waiting gets the error
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_result({"error": str(e)})
+
+    def _apply(self, batch):
+        self.stats["requests"] += len(batch)
+        self.stats["batches"] += 1
+        pending = {}  # (account, op) -> [bytes, futures]
+        def settle():
+            for (account, op), (n, futs) in pending.items():
+                try:
+                    self._count(account, op, n)
+                    reply = {"ok": True}
+                except Exception as e:
+                    reply = {"error": str(e)}
+                self.stats["coalesced"] += len(futs) - 1
+                for f in futs:
+                    f.set_result(dict(reply))
+            pending.clear()
+        for msg, fut in batch:
+            if not isinstance(msg, dict):
+                fut.set_result({"error": "request must be a JSON object"})
+                continue
+            op = msg.get("op")
+            if op in ("read", "write"):
+                try:
+                    n = int(msg.get("bytes", 0))
+                except (TypeError, ValueError):
+                    fut.set_result({"error": "bytes must be an integer"})
+                    continue
+                account = msg.get("account")
+                if account is not None and self.quota is None:
+                    fut.set_result({"error": _NO_QUOTA})
+                    continue
+                if not isinstance(account, (str, type(None))):
+                    fut.set_result({"error": "account must be a string"})
+                    continue
+                slot = pending.setdefault((account, op), [0, []])
+                slot[0] += n
+                slot[1].append(fut)
+                continue
+            settle()  # later ops must see earlier byte counts
+            try:
+                fut.set_result(self._handle(msg))
+            except Exception as e:
+                fut.set_result({"error": str(e)})
+        settle()
+        self._dirty = True
+
+    def _count(self, account, op, n):
+        if account is not None:
+            (self.quota.workspace_read if op == "read" else self.quota.workspace_write)(account, n)
+        elif op == "read":
+            core.workspace_read(n)
+        else:
+            core.workspace_write(n)
+
+    def _handle(self, msg):
+        op, account = msg.get("op"), msg.get("account")
+        if account is not None and self.quota is None:
+            raise ValueError(_NO_QUOTA)
+        if op == "ask":
+            if account is None:
+                return {"answer": core.explainer_answer(msg.get("style"), msg.get("question"))}
+            # accounts have their own cap and no local credits
+            count = lambda: self.quota.increment_messages_used(account)
+            return {"answer": core.explainer_answer(msg.get("style"), msg.get("question"),
+                                                    count_message=count, credit=False)}
+        if op == "set_tier":
+            ok = core.set_tier(msg.get("tier")) if account is None else self.quota.set_tier(account, msg.get("tier"))
+            return {"ok": ok}
+        if op == "resources":
+            if account is not None:
+                return {"resources": self.quota.get_effective_resources(account), "usage": self.quota.usage(account)}
+            wr, rd = core.get_mb_today()
+            return {"resources": core.get_effective_resources(),
+                    "usage": {"tier": core.get_tier(), "read_mb": rd, "written_mb": wr, "credits": core.CREDITS,
+                              "messages_used_today": core.STATE["usage_counters"]["messages_used_today"]}}
+        if op == "allowance":
+            if account is not None:
+                raise ValueError("I/O allowance is only tracked for the local user")
+            return {"allowance": core.get_io_allowance()}
+        if op == "stats":
+            return dict(self.stats)
+        raise ValueError(f"unknown op: {op}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(METER_FLUSH_S)
+            if self._dirty:
+                self._flush()
+
+    def _flush(self):
+        self._dirty = False
+        core.flush_state()
+        if self.quota is not None:
+            self.quota.flush()
+
+def serve(unix_path=None, port=METER_PORT, quota_path=None):
+    try:
+        asyncio.run(MeterServer(quota_path).serve(unix_path=unix_path, port=port))
+    except KeyboardInterrupt:
+        pass
+
+class MeterClient:
+    """Blocking client for scripts and UIs: MeterClient().call("read", bytes=4096)."""
+    def __init__(self, unix_path=None, host="127.0.0.1", port=METER_PORT):
+        if unix_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix_path)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self.rfile = self.sock.makefile("rb")
+
+    def call(self, op, **fields):
+        self.sock.sendall((json.dumps(dict(fields, op=op)) + "\n").encode("utf-8"))
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("meter closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+# --- Load generator ---
+_LOAD_MIX = [
+    {"op": "read", "bytes": 4096},
+    {"op": "write", "bytes": 1024},
+    {"op": "read", "bytes": 65536},
+    {"op": "resources"},
+    {"op": "ask", "style": "simple", "question": "what is python"},
+]
+
+async def _load_client(open_conn, requests, accounts, k, latencies):
+    reader, writer = await open_conn()
+    for i in range(requests):
+        msg = dict(_LOAD_MIX[(i + k) % len(_LOAD_MIX)], id=i)
+        if accounts:
+            msg["account"] = f"acct{(k * 7919 + i) % accounts}"
+        t0 = time.perf_counter()
+        writer.write((json.dumps(msg) + "\n").encode("utf-8"))
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - t0)
+    writer.close()
+
+async def _load(clients, requests, unix_path, port, accounts):
+    if unix_path:
+        open_conn = lambda: asyncio.open_unix_connection(unix_path)
+    else:
+        open_conn = lambda: asyncio.open_connection("127.0.0.1", port)
+    latencies = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_load_client(open_conn, requests, accounts, k, latencies) for k in range(clients)))
+    return latencies, time.perf_counter() - t0
+
+def load_test(clients=50, requests=200, unix_path=None, port=METER_PORT, accounts=0):
+    """Drive a running meter with `clients` connections; returns rps and latency percentiles."""
+    latencies, secs = asyncio.run(_load(clients, requests, unix_path, port, accounts))
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=100)
+    return {"clients": clients, "requests": len(latencies), "seconds": round(secs, 3),
+            "rps": round(len(latencies) / secs, 1), "p50_ms": round(q[49] * 1000, 3),
+            "p99_ms": round(q[98] * 1000, 3)}
+
+def _bench_serve(unix_path, port, quota_path, state_dir):
+    # Benchmark server: its state lives in state_dir, whether the child was
+    # forked or spawned (a spawned child re-imports mvp_core and would persist)
+    core.STATE_FILE = os.path.join(state_dir, "app_state.json")
+    core.USAGE_JOURNAL_FILE = os.path.join(state_dir, "app_state.journal")
+    core._JOURNAL["f"] = None
+    core._LEDGER = None
+    serve(unix_path, port, quota_path)
+
+def run_load_bench(clients=50, requests=200, accounts=0, unix_path=None):
+    """Start a meter in a child process, load it, and stop it.
+
+    The child keeps its state in a temporary directory, so benchmarking
+    leaves the real app_state.json and journal untouched.
+    """
+    port = 0 if unix_path else METER_PORT + 1
+    quota = ":memory:" if accounts else None
+    state_dir = tempfile.mkdtemp(prefix="lde_meter_bench_")
+    proc = Process(target=_bench_serve, args=(unix_path, port, quota, state_dir), daemon=True)
+    proc.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            MeterClient(unix_path, port=port).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                proc.terminate()
+                raise
+            time.sleep(0.05)
+    try:
+        res = load_test(clients, requests, unix_path, port, accounts)
+        c = MeterClient(unix_path, port=port)
+        res["server"] = c.call("stats")
+        c.close()
+        return res
+    finally:
+        proc.terminate()
+        proc.join()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    cmd = args[0] if args else "load"
+    if cmd == "serve":
+        # python lde_meter.py serve [PORT | /path/to.sock] [QUOTA_DB]
+        target = args[1] if len(args) > 1 else str(METER_PORT)
+        quota = args[2] if len(args) > 2 else None
+        if target.isdigit():
+            serve(port=int(target), quota_path=quota)
+        else:
+            serve(unix_path=target, quota_path=quota)
+    else:
+        # python lde_meter.py load [CLIENTS] [REQUESTS] [ACCOUNTS]
+        clients = int(args[1]) if len(args) > 1 else 50
+        reqs = int(args[2]) if len(args) > 2 else 200
+        accounts = int(args[3]) if len(args) > 3 else 0
+        print(run_load_bench(clients, reqs, accounts))
@@ -0,0 +1,178 @@
+# lde_quota.py
+# Per-account quotas for many users: a small __slots__ record per account,
+# an LRU of hot accounts in memory and a SQLite table behind it. Mirrors the
+# single-user mvp_core calls (increment_messages_used, workspace_read/write,
+# get_effective_resources) with an account id in front.
+import sqlite3, threading, time
+from collections import OrderedDict
+import mvp_core as core
+
+TIERS = ("free", "battery", "pro")
+QUOTA_HOT_ACCOUNTS = 100000
+QUOTA_WRITEBACK_BATCH = 1024  # evicted dirty records written per transaction
+
+def _epoch_day():
+    return int(time.time() // 86400)
+
+class AccountRecord:
+    __slots__ = ("account_id", "tier", "day", "messages", "read", "written", "dirty")
+
+    def __init__(self, account_id, tier="free", day=0, messages=0, read=0, written=0):
+        self.account_id = account_id
+        self.tier = tier
+        self.day = day
+        self.messages = messages
+        self.read = read
+        self.written = written
+        self.dirty = False
+
+    def roll(self, today):
+        # daily counters reset when the record is first touched on a new UTC day
+        if self.day != today:
+            self.day = today
+            self.messages = self.read = self.written = 0
+            self.dirty = True
+
+class QuotaStore:
+    """Account quotas with O(1) checks for hot accounts.
+
+    Records not in the LRU are loaded from SQLite on first use (or created
+    on the free tier). Evicted and flushed records are written back only
+    if they changed; evictions are batched, and a record waiting to be
+    written is served from that batch if it is needed again.
+    """
+    def __init__(self, path=":memory:", hot=QUOTA_HOT_ACCOUNTS):
+        self.hot = hot
+        self._lru = OrderedDict()
+        self._evicted = {}
+        self._lock = threading.Lock()
+        self._caps = {t: core.resources_for_tier(t)["daily_cap"] for t in TIERS}
+        self.stats = {"hits": 0, "loads": 0, "creates": 0, "writebacks": 0}
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS accounts (id TEXT PRIMARY KEY, tier TEXT NOT NULL, "
+                         "day INTEGER NOT NULL, messages INTEGER NOT NULL, read INTEGER NOT NULL, "
+                         "written INTEGER NOT NULL) WITHOUT ROWID")
+        self._db.commit()
+
+    def _get(self, account_id):
+        # caller holds the lock
+        rec = self._lru.get(account_id)
+        if rec is not None:
+            self._lru.move_to_end(account_id)
+            self.stats["hits"] += 1
+            return rec
+        rec = self._evicted.pop(account_id, None)
+        row = None if rec else self._db.execute(
+            "SELECT tier, day, messages, read, written FROM accounts WHERE id = ?", (account_id,)).fetchone()
+        if rec:
+            self.stats["loads"] += 1
+        elif row:
+            rec = AccountRecord(account_id, *row)
+            self.stats["loads"] += 1
+        else:
+            rec = AccountRecord(account_id)
+            rec.dirty = True
+            self.stats["creates"] += 1
+        self._lru[account_id] = rec
+        if len(self._lru) > self.hot:
+            _, old = self._lru.popitem(last=False)
+            if old.dirty:
+                self._evicted[old.account_id] = old
+                if len(self._evicted) >= QUOTA_WRITEBACK_BATCH:
+                    self._write(list(self._evicted.values()))
+                    self._evicted.clear()
+        return rec
+
+    def _write(self, recs):
+        self._db.executemany("INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?, ?, ?)",
+                             [(r.account_id, r.tier, r.day, r.messages, r.read, r.written) for r in recs])
+        self._db.commit()
+        for r in recs:
+            r.dirty = False
+        self.stats["writebacks"] += len(recs)
+
+    # --- per-account equivalents of the mvp_core calls ---
+    def set_tier(self, account_id, tier):
+        if tier not in TIERS:
+            return False
+        with self._lock:
+            rec = self._get(account_id)
+            rec.tier = tier
+            rec.dirty = True
+        return True
+
+    def get_tier(self, account_id):
+        with self._lock:
+            return self._get(account_id).tier
+
+    def get_effective_resources(self, account_id):
+        return core.resources_for_tier(self.get_tier(account_id))
+
+    def increment_messages_used(self, account_id):
+        """Count one message if the account is under its tier's daily cap."""
+        today = _epoch_day()
+        with self._lock:
+            rec = self._get(account_id)
+            rec.roll(today)
+            if rec.messages >= self._caps[rec.tier]:
+                return False
+            rec.messages += 1
+            rec.dirty = True
+            return True
+
+    def workspace_read(self, account_id, n_bytes):
+        today = _epoch_day()
+        with self._lock:
+            rec = self._get(account_id)
+            rec.roll(today)
+            rec.read += int(n_bytes)
+            rec.dirty = True
+
+    def workspace_write(self, account_id, n_bytes):
+        today = _epoch_day()
+        with self._lock:
+            rec = self._get(account_id)
+            rec.roll(today)
+            rec.written += int(n_bytes)
+            rec.dirty = True
+
+    def usage(self, account_id):
+        today = _epoch_day()
+        with self._lock:
+            rec = self._get(account_id)
+            rec.roll(today)
+            return {"tier": rec.tier, "messages_used_today": rec.messages, "daily_cap": self._caps[rec.tier],
+                    "bytes_read_today": rec.read, "bytes_written_today": rec.written}
+
+    # --- bulk and maintenance ---
+    def bulk_create(self, account_ids, tier="free"):
+        """Insert many accounts straight into the table (not the LRU)."""
+        today = _epoch_day()
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO accounts VALUES (?, ?, ?, 0, 0, 0)",
+                                 ((a, tier, today) for a in account_ids))
+            self._db.commit()
+
+    def flush(self):
+        with self._lock:
+            dirty = [r for r in self._lru.values() if r.dirty] + list(self._evicted.values())
+            self._evicted.clear()
+            if dirty:
+                self._write(dirty)
+            return len(dirty)
+
+    def count(self):
+        self.flush()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def hit_ratio(self):
+        looked = self.stats["hits"] + self.stats["loads"] + self.stats["creates"]
+        return round(self.stats["hits"] / looked, 3) if looked else 0.0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
@@ -2,54 +2,1263 @@
 import os
 import math
 import json
-from multiprocessing import Pool, cpu_count
+import mmap
+import time
+import zlib
+import hashlib
+import glob
+import lzma
+import sqlite3
+import queue
+import heapq
+import codecs
+import threading
+import atexit
+from functools import partial
+from itertools import islice, count
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import Counter, OrderedDict
+from operator import countOf
+from multiprocessing import Pool, cpu_count, shared_memory, resource_tracker
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional: chunk kernels fall back to pure Python
+    np = None
 
 # --- App State & Persistence ---
 CREDITS = 0
 TERMINAL_ENV = {}
 STATE_FILE = "app_state.json"
 
-def load_state():
+# Usage changes are events: _record() applies one to STATE and appends it to
+# a JSONL journal (an O(1) append) under one lock, so each snapshot matches
+# a journal seq exactly. load_state() rebuilds snapshot + journal tail. The
+# snapshot is rewritten by compaction: STATE_FLUSH_MS after an event (each
+# _record() calls save_state(), which arms one timer for all events until it
+# fires), after USAGE_JOURNAL_COMPACT_EVENTS events (in a background thread),
+# on flush_state() and at exit. Only the process that imported this module
+# persists: forked DPS/FPS workers never write either file.
+USAGE_JOURNAL_FILE = "app_state.journal"
+USAGE_JOURNAL_COMPACT_EVENTS = 5000
+STATE_FLUSH_MS = 500
+_STATE_DIRTY = False
+_STATE_TIMER = None
+_STATE_LOCK = threading.Lock()     # one snapshot/compaction at a time
+_TIMER_LOCK = threading.Lock()     # the flush timer only; taken last, never held while waiting
+_JOURNAL_LOCK = threading.RLock()  # every usage mutation and journal append
+_JOURNAL = {"f": None, "seq": 0, "pending": 0, "compacting": False}
+_STATE_PID = os.getpid()
+
+def _merge_state(dst, src):
+    for k, v in src.items():
+        if isinstance(v, dict) and isinstance(dst.get(k), dict):
+            _merge_state(dst[k], v)
+        else:
+            dst[k] = v
+
+def _apply_event(ev):
     global CREDITS
+    op, v = ev["op"], ev["v"]
+    if op == "credits":
+        CREDITS += v
+        STATE["CREDITS"] = CREDITS
+    elif op == "set":
+        _merge_state(STATE, v)
+    else:
+        _rollover_to(ev["date"])
+        if op == "read":
+            STATE["workspace"]["bytes_read_today"] += v
+        elif op == "write":
+            STATE["workspace"]["bytes_written_today"] += v
+        elif op == "msg":
+            STATE["usage_counters"]["messages_used_today"] += v
+
+def _record(op, v, day=None):
+    """Apply one usage event (dated `day`, default today) to STATE and append it to the journal."""
+    with _JOURNAL_LOCK:
+        ev = {"seq": _JOURNAL["seq"] + 1, "date": day or _today_str(), "op": op, "v": v}
+        _apply_event(ev)
+        _JOURNAL["seq"] = ev["seq"]
+        if os.getpid() != _STATE_PID:
+            return
+        try:
+            if _JOURNAL["f"] is None:
+                _JOURNAL["f"] = open(USAGE_JOURNAL_FILE, "a", encoding="utf-8")
+            _JOURNAL["f"].write(json.dumps(ev, separators=(",", ":")) + "\n")
+            _JOURNAL["f"].flush()
+        except OSError:
+            pass
+        _JOURNAL["pending"] += 1
+        if _JOURNAL["pending"] < USAGE_JOURNAL_COMPACT_EVENTS or _JOURNAL["compacting"]:
+            save_state()
+            return
+        _JOURNAL["compacting"] = True
+    threading.Thread(target=flush_state, name="usage-compactor", daemon=True).start()
+
+def _read_journal(path):
+    events = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line from a crash
+    except OSError:
+        pass
+    return events
+
+def load_state():
+    # {"credits": N} files from older versions still load (credits only)
+    global CREDITS, _ROLLED_UNTIL
     try:
         with open(STATE_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-            CREDITS = int(data.get("credits", 0))
     except Exception:
-        CREDITS = 0
+        data = {}
+    with _JOURNAL_LOCK:
+        try:
+            CREDITS = int(data.get("credits", 0))
+        except (TypeError, ValueError):
+            CREDITS = 0
+        if isinstance(data.get("state"), dict):
+            _merge_state(STATE, data["state"])
+        STATE["CREDITS"] = CREDITS
+        seq = int(data.get("seq", 0))
+        # a compaction that died before finishing leaves its rotated journal behind
+        for ev in _read_journal(USAGE_JOURNAL_FILE + ".old") + _read_journal(USAGE_JOURNAL_FILE):
+            if ev.get("seq", 0) > seq:
+                _apply_event(ev)
+                seq = ev["seq"]
+        _JOURNAL["seq"] = seq
+        _ROLLED_UNTIL = 0.0  # loaded state may be from an earlier day
 
 def save_state():
-    try:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump({"credits": CREDITS}, f)
-    except Exception:
-        pass
+    """Snapshot within STATE_FLUSH_MS; calls until then share the one write."""
+    global _STATE_DIRTY, _STATE_TIMER
+    if os.getpid() != _STATE_PID:
+        return
+    with _TIMER_LOCK:
+        _STATE_DIRTY = True
+        if _STATE_TIMER is None:
+            _STATE_TIMER = threading.Timer(STATE_FLUSH_MS / 1000.0, flush_state)
+            _STATE_TIMER.daemon = True
+            _STATE_TIMER.start()
+
+def flush_state():
+    """Fold the journal into a new snapshot now; returns True if one was written.
+
+    The journal is rotated aside under the lock together with the snapshot
+    seq, so events recorded meanwhile land in a fresh journal. The rotated
+    file is removed only after the snapshot is safely on disk.
+    """
+    global _STATE_DIRTY, _STATE_TIMER
+    if os.getpid() != _STATE_PID:
+        return False
+    old = USAGE_JOURNAL_FILE + ".old"
+    merge_counters()
+    with _STATE_LOCK:
+        with _TIMER_LOCK:
+            if _STATE_TIMER is not None:
+                _STATE_TIMER.cancel()
+                _STATE_TIMER = None
+        with _JOURNAL_LOCK:
+            _JOURNAL["compacting"] = False
+            if not (_STATE_DIRTY or _JOURNAL["pending"]):
+                return False
+            if _JOURNAL["f"] is not None:
+                _JOURNAL["f"].close()
+                _JOURNAL["f"] = None
+            try:
+                if os.path.exists(old):  # keep the unfinished rotation's events too
+                    with open(old, "a", encoding="utf-8") as dst, open(USAGE_JOURNAL_FILE, "r", encoding="utf-8") as src:
+                        dst.write(src.read())
+                    os.remove(USAGE_JOURNAL_FILE)
+                else:
+                    os.replace(USAGE_JOURNAL_FILE, old)
+            except OSError:
+                pass  # no journal yet
+            snapshot = json.dumps({"credits": CREDITS, "seq": _JOURNAL["seq"], "state": STATE})
+            _JOURNAL["pending"] = 0
+            _STATE_DIRTY = False
+        try:
+            _atomic_write_json(STATE_FILE, snapshot)
+        except Exception:
+            _STATE_DIRTY = True  # the rotated journal stays until a snapshot succeeds
+            return False
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+        return True
+
+atexit.register(flush_state)
 
 # --- Utilities ---
 def add_credits(amount=1):
-    global CREDITS
-    CREDITS += amount
-    save_state()
+    _record("credits", amount)
+
+# --- I/O throttling ---
+# One token bucket per direction, refilled at the tier's bytes/second. The
+# daily budget is workspace_cache_mb per direction: past IO_BACKOFF_START of
+# it the rate eases down linearly to the tier's floor, which then holds for
+# the rest of the day, so heavy jobs slow down instead of failing. Usage is
+# the persisted workspace counters plus bytes through the buckets that are
+# not recorded yet, so the budget survives restarts and worker recycling.
+IO_TIER_LIMITS = {
+    "free": {"read_bps": 16 * 1024 * 1024, "write_bps": 8 * 1024 * 1024, "floor_bps": 256 * 1024},
+    "battery": {"read_bps": 64 * 1024 * 1024, "write_bps": 32 * 1024 * 1024, "floor_bps": 1024 * 1024},
+    "pro": {"read_bps": 512 * 1024 * 1024, "write_bps": 256 * 1024 * 1024, "floor_bps": 8 * 1024 * 1024},
+}
+IO_BACKOFF_START = 0.8
+IO_RATE_REFRESH_S = 0.1  # how long a computed rate is reused
+IO_BURST_S = 1.0         # seconds of traffic a quiet bucket lets through at once
+IO_THROTTLE = True
+IO_STATS = {"waits": 0, "throttled_s": 0.0}
+_IO_SHARE = 1.0  # fraction of the rate this process may use (parallel FPS workers split it)
+_IO_BASE = None  # parallel FPS workers: recorded usage handed over with the range
+_IO_PENDING = {"day": "", "read": 0, "write": 0}  # through the buckets, not yet recorded
+_IO_RATES = {}
+
+class TokenBucket:
+    """Bytes-per-second bucket with up to IO_BURST_S of burst.
+
+    Kept as the time at which everything reserved so far has drained, so a
+    rate change only affects bytes reserved after it. reserve() always
+    succeeds: it returns how long the caller must sleep for its bytes to
+    fit the rate, so a large chunk just waits longer.
+    """
+    def __init__(self):
+        self.drained_at = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, n, rate):
+        with self._lock:
+            now = time.monotonic()
+            self.drained_at = max(self.drained_at, now) + n / rate
+            return max(0.0, self.drained_at - now - IO_BURST_S)
+
+_IO_BUCKETS = {"read": TokenBucket(), "write": TokenBucket()}
+
+def _io_used(direction):
+    # recorded usage plus unrecorded bytes; a worker's own bytes stand for its share of the traffic
+    if _IO_PENDING["day"] != _today_str():
+        _IO_PENDING.update(day=_today_str(), read=0, write=0)
+    if _IO_BASE is not None:
+        recorded = _IO_BASE[direction]
+    elif direction == "read":
+        recorded = STATE["workspace"]["bytes_read_today"] + sum(c.read - c.merged_read for c in list(_COUNTERS))
+    else:
+        recorded = STATE["workspace"]["bytes_written_today"] + sum(c.written - c.merged_written for c in list(_COUNTERS))
+    return recorded + _IO_PENDING[direction] / _IO_SHARE
+
+def _io_recorded(direction, n_bytes):
+    # workspace_read/write took over these bytes
+    _IO_PENDING[direction] = max(0, _IO_PENDING[direction] - n_bytes)
+
+def _io_rate(direction):
+    tier = get_tier()
+    lim = IO_TIER_LIMITS.get(tier, IO_TIER_LIMITS["free"])
+    budget = resources_for_tier(tier)["workspace_cache_mb"] * 1024 * 1024
+    full, floor = lim[direction + "_bps"], lim["floor_bps"]
+    frac = _io_used(direction) / budget
+    if frac <= IO_BACKOFF_START:
+        return full
+    if frac >= 1:
+        return floor
+    return full + (floor - full) * (frac - IO_BACKOFF_START) / (1 - IO_BACKOFF_START)
+
+def throttle_io(direction, n_bytes):
+    """Sleep as long as the tier's bucket needs for n_bytes ("read" or "write"); never fails."""
+    if not IO_THROTTLE or n_bytes <= 0:
+        return 0.0
+    now = time.monotonic()
+    cached = _IO_RATES.get(direction)
+    if cached is None or now >= cached[1]:
+        cached = _IO_RATES[direction] = (_io_rate(direction), now + IO_RATE_REFRESH_S)
+    _IO_PENDING[direction] += n_bytes
+    wait = _IO_BUCKETS[direction].reserve(n_bytes, cached[0] * _IO_SHARE)
+    if wait > 0:
+        IO_STATS["waits"] += 1
+        IO_STATS["throttled_s"] += wait
+        time.sleep(wait)
+    return wait
+
+def get_io_allowance():
+    """Current I/O rates and what is left of today's byte budget, per direction."""
+    merge_counters()
+    tier = get_tier()
+    budget = resources_for_tier(tier)["workspace_cache_mb"] * 1024 * 1024
+    out = {"tier": tier, "budget_mb": round(budget / (1024 * 1024), 2), "throttling": IO_THROTTLE,
+           "throttled_s": round(IO_STATS["throttled_s"], 3)}
+    for d in ("read", "write"):
+        used = _io_used(d)
+        out[d] = {"rate_mbps": round(_io_rate(d) / (1024 * 1024), 2), "used_mb": round(used / (1024 * 1024), 2),
+                  "left_mb": round(max(0, budget - used) / (1024 * 1024), 2),
+                  "backing_off": used > budget * IO_BACKOFF_START}
+    return out
 
 # =========================
 # FPS: File Processing System
 # =========================
 
-def read_in_chunks(path, chunk_size=4096):
-    """Yield bytes chunks from file safely."""
+def _sizer(chunk_size):
+    # Readers accept a fixed size or a callable returning the next size
+    if callable(chunk_size):
+        return lambda: max(1, int(chunk_size()))
+    size = max(1, int(chunk_size))
+    return lambda: size
+
+def read_in_chunks(path, chunk_size=4096, start=0, end=None):
+    """Yield bytes chunks from file safely (optionally only bytes [start, end))."""
+    next_size = _sizer(chunk_size)
     with open(path, "rb") as f:
-        while True:
-            data = f.read(chunk_size)
+        if start:
+            f.seek(start)
+        left = None if end is None else end - start
+        while left is None or left > 0:
+            want = next_size()
+            data = f.read(want if left is None else min(want, left))
             if not data:
                 break
+            if left is not None:
+                left -= len(data)
+            throttle_io("read", len(data))
             yield data
 
-def process_chunk(chunk_bytes):
-    """Placeholder processing for a chunk: count bytes and lines and checksum."""
-    byte_len = len(chunk_bytes)
-    line_count = chunk_bytes.count(b"")
-    checksum = sum(chunk_bytes) % 9973
-    return {"bytes": byte_len, "lines": line_count, "checksum": checksum}
+# Files at least this large are memory-mapped by the zero-copy reader
+MMAP_MIN_BYTES = 8 * 1024 * 1024
+
+def read_into_chunks(path, chunk_size=4096, start=0, end=None):
+    """Yield memoryview chunks filled into one reused buffer via readinto.
+
+    The buffer only grows when a larger chunk size is requested. Each chunk
+    is only valid until the next one is requested.
+    """
+    next_size = _sizer(chunk_size)
+    buf = bytearray(0)
+    view = memoryview(buf)
+    try:
+        with open(path, "rb") as f:
+            if start:
+                f.seek(start)
+            left = None if end is None else end - start
+            while left is None or left > 0:
+                want = next_size()
+                if left is not None:
+                    want = min(want, left)
+                if want > len(buf):
+                    view.release()
+                    buf = bytearray(want)
+                    view = memoryview(buf)
+                n = f.readinto(view[:want])
+                if not n:
+                    break
+                if left is not None:
+                    left -= n
+                throttle_io("read", n)
+                piece = view[:n]
+                try:
+                    yield piece
+                finally:
+                    piece.release()  # also when the consumer abandons the generator
+    finally:
+        view.release()
+
+def mmap_chunks(path, chunk_size=4096, start=0, end=None):
+    """Yield memoryview slices of a read-only mapping of the file.
+
+    Each chunk is only valid until the next one is requested.
+    """
+    next_size = _sizer(chunk_size)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mm)
+            try:
+                off = start
+                while off < end:
+                    piece = view[off:min(off + next_size(), end)]
+                    off += len(piece)
+                    throttle_io("read", len(piece))
+                    try:
+                        yield piece
+                    finally:
+                        piece.release()  # else an abandoned generator can't close the mapping
+            finally:
+                view.release()
+
+def zerocopy_chunks(path, chunk_size=4096, start=0, end=None):
+    """Zero-copy reader: mmap for large regular files, readinto otherwise."""
+    try:
+        st = os.stat(path)
+        span = (st.st_size if end is None else min(end, st.st_size)) - start
+        use_mmap = os.path.isfile(path) and span >= MMAP_MIN_BYTES
+    except OSError:
+        use_mmap = False
+    if use_mmap:
+        return mmap_chunks(path, chunk_size, start, end)
+    return read_into_chunks(path, chunk_size, start, end)
+
+FPS_READERS = {
+    "stream": read_in_chunks,      # fresh bytes object per chunk
+    "zerocopy": zerocopy_chunks,   # reused buffer / mapping, memoryview chunks
+}
+
+# --- Adaptive chunk sizing ---
+FPS_AUTO_MIN_CHUNK = 64 * 1024
+FPS_AUTO_MAX_CHUNK = 64 * 1024 * 1024
+FPS_AUTO_MEMORY_SHARE = 8  # one chunk may take 1/8 of processing_memory_mb
+
+class AdaptiveChunker:
+    """Chunk-size source for FPS readers that tunes itself while a job runs.
+
+    Each call returns the next chunk size. Every `window` chunks the measured
+    bytes/sec decides the next move: keep doubling/halving while it helps,
+    turn around when it hurts, hold when the gain is within 5%. Sizes stay
+    between FPS_AUTO_MIN_CHUNK and a cap from the tier's processing_memory_mb.
+    """
+    def __init__(self, memory_mb=None, start=256 * 1024, window=4):
+        if memory_mb is None:
+            memory_mb = get_effective_resources()["processing_memory_mb"]
+        cap = int(memory_mb * 1024 * 1024) // FPS_AUTO_MEMORY_SHARE
+        self.cap = max(FPS_AUTO_MIN_CHUNK, min(FPS_AUTO_MAX_CHUNK, cap))
+        self.size = max(FPS_AUTO_MIN_CHUNK, min(start, self.cap))
+        self.window = window
+        self.grow = True
+        self.prev_rate = None
+        self._bytes, self._secs, self._n = 0, 0.0, 0
+        self._t, self._last = None, 0
+
+    def __call__(self):
+        now = time.perf_counter()
+        if self._t is not None:
+            self._observe(self._last, now - self._t)
+        self._t, self._last = now, self.size
+        return self.size
+
+    def _observe(self, nbytes, secs):
+        self._bytes += nbytes
+        self._secs += secs
+        self._n += 1
+        if self._n < self.window:
+            return
+        rate = self._bytes / max(self._secs, 1e-9)
+        self._bytes, self._secs, self._n = 0, 0.0, 0
+        prev, self.prev_rate = self.prev_rate, rate
+        if prev is not None:
+            if rate < prev * 0.95:
+                self.grow = not self.grow  # last move hurt: go back
+            elif rate <= prev * 1.05:
+                return                     # plateau: stay here
+        new = self.size * 2 if self.grow else self.size // 2
+        new = max(FPS_AUTO_MIN_CHUNK, min(self.cap, new))
+        if new == self.size:
+            self.grow = not self.grow
+        self.size = new
+
+def _resolve_chunk_size(chunk_size):
+    # "auto" (or ("auto", memory_mb) for pool workers) becomes a fresh AdaptiveChunker
+    if chunk_size == "auto":
+        return AdaptiveChunker()
+    if isinstance(chunk_size, tuple) and chunk_size[0] == "auto":
+        return AdaptiveChunker(memory_mb=chunk_size[1])
+    return chunk_size
+
+# --- FPS chunk kernels ---
+# Each kernel maps one chunk to a partial value ("py" / optional NumPy "np"),
+# and "merge" combines partials of adjacent byte ranges in file order. An
+# optional "fold" extends a running value with the next chunk directly.
+CHUNK_KERNELS = {}
+KERNEL_BACKEND = "auto"  # auto | numpy | python
+
+def register_kernel(name, py, np_impl=None, merge=None, fold=None, final=None):
+    CHUNK_KERNELS[name] = {"py": py, "np": np_impl, "merge": merge or (lambda a, b: a + b),
+                           "fold": fold, "final": final}
+
+def _use_numpy(backend=None):
+    backend = backend or KERNEL_BACKEND
+    if backend == "numpy" and np is None:
+        raise RuntimeError("numpy backend requested but numpy is not installed")
+    return np is not None and backend != "python"
+
+def _py_newlines(buf):
+    if isinstance(buf, bytes):
+        return buf.count(b"\n")
+    return countOf(buf, 10)  # b"\n", no copy for memoryview chunks
+
+def _py_histogram(buf):
+    c = Counter(buf)
+    return [c.get(i, 0) for i in range(256)]
+
+def _py_line_length(buf):
+    lens = [len(x) for x in bytes(buf).split(b"\n")]
+    return _line_segment(lens)
+
+def _np_line_length(arr):
+    pos = np.flatnonzero(arr == 10)
+    if not len(pos):
+        return _line_segment([len(arr)])
+    inner = (np.diff(pos) - 1) if len(pos) > 1 else None
+    return (True, int(pos[0]), None if inner is None else int(inner.min()),
+            None if inner is None else int(inner.max()), int(len(arr) - pos[-1] - 1))
+
+def _line_segment(lens):
+    # (has_newline, head, inner_min, inner_max, tail) for lengths split on newlines
+    if len(lens) == 1:
+        return (False, lens[0], None, None, lens[0])
+    inner = lens[1:-1]
+    return (True, lens[0], min(inner) if inner else None, max(inner) if inner else None, lens[-1])
+
+def _lo(*xs):
+    xs = [x for x in xs if x is not None]
+    return min(xs) if xs else None
+
+def _hi(*xs):
+    xs = [x for x in xs if x is not None]
+    return max(xs) if xs else None
+
+def _merge_line_length(a, b):
+    a_nl, a_head, a_lo, a_hi, a_tail = a
+    b_nl, b_head, b_lo, b_hi, b_tail = b
+    if not a_nl and not b_nl:
+        n = a_head + b_head
+        return (False, n, None, None, n)
+    if not a_nl:
+        return (True, a_head + b_head, b_lo, b_hi, b_tail)
+    if not b_nl:
+        return (True, a_head, a_lo, a_hi, a_tail + b_head)
+    mid = a_tail + b_head
+    return (True, a_head, _lo(a_lo, b_lo, mid), _hi(a_hi, b_hi, mid), b_tail)
+
+def _final_line_length(v):
+    has_nl, head, lo, hi, tail = v
+    lens = [head, lo, hi] + ([tail] if has_nl and tail else [])
+    if not has_nl and not head:
+        return {"min": 0, "max": 0}
+    return {"min": _lo(*lens), "max": _hi(*lens)}
+
+def _gf2_times(mat, vec):
+    s, i = 0, 0
+    while vec:
+        if vec & 1:
+            s ^= mat[i]
+        vec >>= 1
+        i += 1
+    return s
+
+def _gf2_square(mat):
+    return [_gf2_times(mat, row) for row in mat]
+
+def crc32_combine(crc1, crc2, len2):
+    """CRC-32 of A+B from crc32(A), crc32(B) and len(B) (zlib's crc32_combine)."""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << i for i in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+def adler32_combine(adler1, adler2, len2):
+    """Adler-32 of A+B from adler32(A), adler32(B) and len(B) (zlib's adler32_combine)."""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xFFFF) + base - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + base - rem
+    if sum1 >= base: sum1 -= base
+    if sum1 >= base: sum1 -= base
+    if sum2 >= (base << 1): sum2 -= (base << 1)
+    if sum2 >= base: sum2 -= base
+    return sum1 | (sum2 << 16)
+
+register_kernel("bytes", len)
+register_kernel("byte_sum", sum, lambda arr: int(arr.sum(dtype=np.uint64)))
+register_kernel("newlines", _py_newlines, lambda arr: int(np.count_nonzero(arr == 10)))
+register_kernel("histogram", _py_histogram,
+                lambda arr: np.bincount(arr, minlength=256).tolist(),
+                merge=lambda a, b: [x + y for x, y in zip(a, b)])
+register_kernel("crc32", lambda buf: (zlib.crc32(buf), len(buf)),
+                merge=lambda a, b: (crc32_combine(a[0], b[0], b[1]), a[1] + b[1]),
+                fold=lambda acc, buf: (zlib.crc32(buf, acc[0]), acc[1] + len(buf)),
+                final=lambda v: v[0])
+register_kernel("adler32", lambda buf: (zlib.adler32(buf), len(buf)),
+                merge=lambda a, b: (adler32_combine(a[0], b[0], b[1]), a[1] + b[1]),
+                fold=lambda acc, buf: (zlib.adler32(buf, acc[0]), acc[1] + len(buf)),
+                final=lambda v: v[0])
+register_kernel("line_length", _py_line_length, _np_line_length,
+                merge=_merge_line_length, final=_final_line_length)
+
+def _check_kernels(names):
+    unknown = [k for k in names if k not in CHUNK_KERNELS]
+    if unknown:
+        raise ValueError(f"Unknown chunk kernel(s): {', '.join(unknown)}")
+
+def run_kernels(names, buf, backend=None):
+    """Partial value of each named kernel for one chunk."""
+    vec = _use_numpy(backend) and any(CHUNK_KERNELS[n]["np"] for n in names)
+    arr = np.frombuffer(buf, dtype=np.uint8) if vec else None
+    out = {}
+    for name in names:
+        k = CHUNK_KERNELS[name]
+        out[name] = k["np"](arr) if arr is not None and k["np"] else k["py"](buf)
+    return out
+
+def fold_kernels(names, acc, buf, backend=None):
+    """Extend running kernel values (None = nothing yet) with the next chunk."""
+    arr = None
+    for name in names:
+        k = CHUNK_KERNELS[name]
+        prev = acc.get(name)
+        if prev is not None and k["fold"]:
+            acc[name] = k["fold"](prev, buf)
+            continue
+        if arr is None and k["np"] and _use_numpy(backend):
+            arr = np.frombuffer(buf, dtype=np.uint8)
+        part = k["np"](arr) if arr is not None and k["np"] else k["py"](buf)
+        acc[name] = part if prev is None else k["merge"](prev, part)
+    return acc
+
+def merge_kernels(names, a, b):
+    """Combine running kernel values of two adjacent ranges (a comes first)."""
+    out = {}
+    for name in names:
+        x, y = a.get(name), b.get(name)
+        out[name] = y if x is None else x if y is None else CHUNK_KERNELS[name]["merge"](x, y)
+    return out
+
+def finalize_kernels(names, acc):
+    out = {}
+    for name in names:
+        k, v = CHUNK_KERNELS[name], acc.get(name)
+        if v is None:
+            v = k["py"](b"")  # nothing folded in: the kernel's value for no bytes
+        out[name] = k["final"](v) if k["final"] else v
+    return out
+
+def process_chunk(chunk_bytes, kernels=None, backend=None):
+    """Placeholder processing for a chunk: count bytes and lines and checksum.
+
+    Accepts bytes or a memoryview slice without copying it. With `kernels`,
+    returns the named kernels' partial values instead.
+    """
+    if kernels is not None:
+        return run_kernels(kernels, chunk_bytes, backend)
+    part = run_kernels(("bytes", "newlines", "byte_sum"), chunk_bytes, backend)
+    return {"bytes": part["bytes"], "lines": part["newlines"], "checksum": part["byte_sum"] % 9973}
+
+# --- Streaming reducers ---
+# Mergeable, constant-memory aggregates. FPS folds each chunk into them as it
+# goes, and parallel workers' partial reducers merge back in file order.
+
+class _Reducer:
+    __slots__ = ()
+    def to_state(self):
+        """JSON-friendly snapshot, restored with from_state."""
+        return {k: getattr(self, k) for k in self.__slots__}
+    @classmethod
+    def from_state(cls, state):
+        red = cls.__new__(cls)
+        for k, v in state.items():
+            setattr(red, k, v)
+        return red
+
+class CountReducer(_Reducer):
+    __slots__ = ("n",)
+    def __init__(self):
+        self.n = 0
+    def add(self, x=None):
+        self.n += 1
+    def merge(self, other):
+        self.n += other.n
+        return self
+    def result(self):
+        return self.n
+
+class SumReducer(_Reducer):
+    __slots__ = ("total",)
+    def __init__(self):
+        self.total = 0
+    def add(self, x):
+        self.total += x
+    def merge(self, other):
+        self.total += other.total
+        return self
+    def result(self):
+        return self.total
+
+class MeanReducer(_Reducer):
+    __slots__ = ("n", "total")
+    def __init__(self):
+        self.n, self.total = 0, 0
+    def add(self, x):
+        self.n += 1
+        self.total += x
+    def merge(self, other):
+        self.n += other.n
+        self.total += other.total
+        return self
+    def result(self):
+        return self.total / self.n if self.n else 0.0
+
+class MinMaxReducer(_Reducer):
+    __slots__ = ("lo", "hi")
+    def __init__(self):
+        self.lo, self.hi = None, None
+    def add(self, x):
+        if self.lo is None or x < self.lo: self.lo = x
+        if self.hi is None or x > self.hi: self.hi = x
+    def merge(self, other):
+        if other.lo is not None:
+            self.add(other.lo)
+            self.add(other.hi)
+        return self
+    def result(self):
+        return {"min": self.lo, "max": self.hi}
+
+class QuantileReducer(_Reducer):
+    """Approximate quantiles of non-negative values via log-spaced buckets.
+
+    Estimates are within `accuracy` relative error; memory grows with the
+    log of the value range, not with the number of values.
+    """
+    __slots__ = ("accuracy", "gamma", "buckets", "zeros", "n", "lo", "hi")
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.buckets = {}
+        self.zeros = 0
+        self.n = 0
+        self.lo, self.hi = None, None
+    def add(self, x):
+        if x < 0:
+            raise ValueError("QuantileReducer only accepts non-negative values")
+        self.n += 1
+        if self.lo is None or x < self.lo: self.lo = x
+        if self.hi is None or x > self.hi: self.hi = x
+        if x == 0:
+            self.zeros += 1
+            return
+        i = math.ceil(math.log(x, self.gamma))
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge quantile reducers with different accuracy")
+        for i, c in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + c
+        self.zeros += other.zeros
+        self.n += other.n
+        if other.lo is not None:
+            self.lo = other.lo if self.lo is None else min(self.lo, other.lo)
+            self.hi = other.hi if self.hi is None else max(self.hi, other.hi)
+        return self
+    def quantile(self, q):
+        if not self.n:
+            return None
+        rank = q * (self.n - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if rank < seen:
+                est = 2 * self.gamma ** i / (self.gamma + 1)
+                return min(max(est, self.lo), self.hi)
+        return self.hi
+    def to_state(self):
+        state = _Reducer.to_state(self)
+        state["buckets"] = sorted(self.buckets.items())
+        return state
+    @classmethod
+    def from_state(cls, state):
+        red = _Reducer.from_state.__func__(cls, state)
+        red.buckets = {int(i): c for i, c in state["buckets"]}
+        return red
+    def result(self, qs=(0.5, 0.9, 0.99)):
+        out = {"min": self.lo, "max": self.hi}
+        for q in qs:
+            out[f"p{int(q * 100)}"] = self.quantile(q)
+        return out
+
+class KernelReducer(_Reducer):
+    """Running values of named chunk kernels (see CHUNK_KERNELS)."""
+    __slots__ = ("names", "acc")
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.acc = {}
+    def add(self, chunk):
+        fold_kernels(self.names, self.acc, chunk)
+    def merge(self, other):
+        self.acc = merge_kernels(self.names, self.acc, other.acc)
+        return self
+    def result(self):
+        return finalize_kernels(self.names, self.acc)
+    @classmethod
+    def from_state(cls, state):
+        red = _Reducer.from_state.__func__(cls, state)
+        red.names = tuple(red.names)
+        return red
+
+def merge_reducers(a, b):
+    """Merge reducer dict b (the later range) into a; returns a."""
+    for name, red in b.items():
+        if name in a:
+            a[name].merge(red)
+        else:
+            a[name] = red
+    return a
+
+REDUCER_TYPES = {cls.__name__: cls for cls in (CountReducer, SumReducer, MeanReducer,
+                                                MinMaxReducer, QuantileReducer, KernelReducer)}
+
+def aggregate_state(agg):
+    return {name: [type(red).__name__, red.to_state()] for name, red in agg.items()}
+
+def load_aggregate(state):
+    return {name: REDUCER_TYPES[kind].from_state(st) for name, (kind, st) in state.items()}
+
+def _fps_load_aggregate(state, kernels=()):
+    # Fresh reducers fill in anything an older saved state did not have
+    agg = fps_new_aggregate(kernels)
+    agg.update(load_aggregate(state))
+    return agg
+
+def fps_new_aggregate(kernels=()):
+    agg = {"chunks": CountReducer(), "bytes": SumReducer(), "lines": SumReducer(),
+           "checksum": MeanReducer(), "lines_per_chunk": QuantileReducer(),
+           "chunk_bytes": QuantileReducer()}
+    if kernels:
+        agg["kernels"] = KernelReducer(kernels)
+    return agg
+
+def fps_fold(agg, chunk):
+    """Process one chunk and fold it into the running FPS aggregate."""
+    res = process_chunk(chunk)
+    agg["chunks"].add()
+    agg["bytes"].add(res["bytes"])
+    agg["lines"].add(res["lines"])
+    agg["checksum"].add(res["checksum"])
+    agg["lines_per_chunk"].add(res["lines"])
+    agg["chunk_bytes"].add(res["bytes"])
+    if "kernels" in agg:
+        agg["kernels"].add(chunk)
+    return agg
+
+# Parallel FPS never splits a file into ranges smaller than this
+FPS_MIN_RANGE_BYTES = 1024 * 1024
+FPS_RANGE_COST_S = 1.0  # scheduler cost hint for one range (always runs solo)
+
+def _next_line_start(f, pos, size, scan=64 * 1024):
+    """Offset of the first byte after the first newline at or after pos - 1."""
+    if pos <= 0:
+        return 0
+    f.seek(pos - 1)
+    at = pos - 1
+    while at < size:
+        block = f.read(scan)
+        if not block:
+            break
+        i = block.find(b"\n")
+        if i >= 0:
+            return at + i + 1
+        at += len(block)
+    return size
+
+def split_line_ranges(path, parts):
+    """Split a file into up to `parts` (start, end) byte ranges ending on line boundaries."""
+    size = os.path.getsize(path)
+    if not size:
+        return []
+    parts = max(1, min(int(parts), size))
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            pos = _next_line_start(f, size * i // parts, size)
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _atomic_write_json(path, obj):
+    """Write JSON (or already-encoded JSON text) via a temp file and rename it into place."""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            if isinstance(obj, str):
+                f.write(obj)
+            else:
+                json.dump(obj, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# --- FPS checkpoints ---
+FPS_CHECKPOINT_DIR = ".lde_checkpoints"
+FPS_CHECKPOINT_EVERY_S = 5.0  # seconds between checkpoint writes
+
+class FpsCheckpoint:
+    """Periodic, atomically written resume point for one serial FPS job.
+
+    A checkpoint is only reused while the file's size and mtime are unchanged.
+    """
+    def __init__(self, path, chunk_size, kernels=(), every=FPS_CHECKPOINT_EVERY_S):
+        self.path = os.path.abspath(path)
+        key = json.dumps([self.path, chunk_size, list(kernels)])
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".json"
+        self.file = os.path.join(FPS_CHECKPOINT_DIR, name)
+        self.every = every
+        self.kernels = tuple(kernels)
+        st = os.stat(self.path)
+        self.size, self.mtime = st.st_size, st.st_mtime_ns
+        self._last = time.monotonic()
+
+    def load(self):
+        """(offset, aggregate) to resume from, or (0, None)."""
+        try:
+            with open(self.file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if (data["path"], data["size"], data["mtime"]) != (self.path, self.size, self.mtime):
+                return 0, None
+            return int(data["offset"]), _fps_load_aggregate(data["state"], self.kernels)
+        except Exception:
+            return 0, None
+
+    def maybe_save(self, offset, agg):
+        now = time.monotonic()
+        if now - self._last >= self.every:
+            self.save(offset, agg)
+            self._last = now
+
+    def save(self, offset, agg):
+        try:
+            _atomic_write_json(self.file, {
+                "path": self.path, "size": self.size, "mtime": self.mtime,
+                "offset": offset, "state": aggregate_state(agg),
+            })
+        except OSError:
+            pass
+
+    def clear(self):
+        try:
+            os.remove(self.file)
+        except OSError:
+            pass
+
+def _fps_scan(path, chunk_size, reader, kernels=(), start=0, end=None, on_chunk=None,
+              agg=None, checkpoint=None, record=False):
+    """Fold bytes [start, end) serially into an FPS aggregate (fresh unless given).
+
+    record=True counts each chunk through workspace_read as it is folded.
+    """
+    agg = agg or fps_new_aggregate(kernels)
+    offset = start
+    for chunk in FPS_READERS[reader](path, _resolve_chunk_size(chunk_size), start, end):
+        fps_fold(agg, chunk)
+        offset += len(chunk)
+        if record:
+            workspace_read(len(chunk))
+        if checkpoint:
+            checkpoint.maybe_save(offset, agg)
+        if on_chunk:
+            on_chunk(agg["chunks"].n)
+    return agg
+
+# --- FPS result cache ---
+# Per-file records of segment results, keyed by file identity (path, device,
+# inode) and each segment's BLAKE2 fingerprint. Unchanged files are answered
+# from the stored total; appended files only process the new tail.
+FPS_CACHE_DIR = ".lde_cache"
+FPS_CACHE_SEGMENT_BYTES = 4 * 1024 * 1024
+FPS_CACHE_STATS = {"file_hits": 0, "file_misses": 0, "segment_hits": 0,
+                   "segment_misses": 0, "evictions": 0}
+
+def fps_cache_stats():
+    st = dict(FPS_CACHE_STATS)
+    files = st["file_hits"] + st["file_misses"]
+    segs = st["segment_hits"] + st["segment_misses"]
+    st["file_hit_ratio"] = round(st["file_hits"] / files, 3) if files else 0.0
+    st["segment_hit_ratio"] = round(st["segment_hits"] / segs, 3) if segs else 0.0
+    return st
+
+def _fps_cache_file(path, chunk_size, kernels):
+    key = json.dumps(["fps", os.path.abspath(path), chunk_size, list(kernels)])
+    return os.path.join(FPS_CACHE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".json")
+
+def _segment_digest(path, start, end, reader):
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in FPS_READERS[reader](path, 1024 * 1024, start, end):
+        h.update(chunk)
+    return h.hexdigest()
+
+def _fps_scan_segment(path, chunk_size, reader, kernels, start, end):
+    agg, h = fps_new_aggregate(kernels), hashlib.blake2b(digest_size=16)
+    for chunk in FPS_READERS[reader](path, chunk_size, start, end):
+        fps_fold(agg, chunk)
+        h.update(chunk)
+    return agg, h.hexdigest()
+
+def fps_cache_evict(keep=None):
+    """Drop least recently used cache records until under the tier's workspace_cache_mb."""
+    budget = get_effective_resources()["workspace_cache_mb"] * 1024 * 1024
+    try:
+        names = os.listdir(FPS_CACHE_DIR)
+    except OSError:
+        return
+    files = []
+    for name in names:
+        p = os.path.join(FPS_CACHE_DIR, name)
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+    total = sum(f[1] for f in files)
+    for _, size, p in sorted(files):
+        if total <= budget:
+            break
+        if p == keep:
+            continue
+        try:
+            os.remove(p)
+            total -= size
+            FPS_CACHE_STATS["evictions"] += 1
+        except OSError:
+            pass
+
+def _fps_cached_scan(path, chunk_size, reader, kernels, on_chunk=None,
+                     save_every=FPS_CHECKPOINT_EVERY_S, append_only=False):
+    cfile = _fps_cache_file(path, chunk_size, kernels)
+    st = os.stat(path)
+    ident = [os.path.abspath(path), st.st_dev, st.st_ino]
+    seg_bytes = max(1, FPS_CACHE_SEGMENT_BYTES // max(1, chunk_size)) * max(1, chunk_size)
+    try:
+        with open(cfile, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry["ident"] != ident or entry["seg_bytes"] != seg_bytes:
+            entry = None
+    except Exception:
+        entry = None
+    unchanged = entry is not None and (entry["size"], entry["mtime"]) == (st.st_size, st.st_mtime_ns)
+    if unchanged and entry["complete"]:
+        FPS_CACHE_STATS["file_hits"] += 1
+        try: os.utime(cfile)  # LRU touch
+        except OSError: pass
+        return _fps_load_aggregate(entry["total"], kernels)
+    FPS_CACHE_STATS["file_misses"] += 1
+
+    # Reuse full-length segments whose fingerprint still matches. Only an
+    # unchanged file (interrupted run) trusts its segments outright; with
+    # append_only=True a grown file also trusts all but its last old segment.
+    appended = entry is not None and st.st_size > entry["size"]
+    old = [seg for seg in (entry["segments"] if entry else []) if seg[1] == seg_bytes]
+    agg, segments, offset = fps_new_aggregate(kernels), [], 0
+    record = {"ident": ident, "seg_bytes": seg_bytes, "size": st.st_size,
+              "mtime": st.st_mtime_ns, "complete": False, "segments": segments}
+
+    def save():
+        record["total"] = aggregate_state(agg)
+        try: _atomic_write_json(cfile, record)
+        except OSError: pass
+
+    last_save = time.monotonic()
+    for i, (off, length, digest, state) in enumerate(old):
+        if off != offset or off + length > st.st_size:
+            break
+        trusted = unchanged or (append_only and appended and i < len(old) - 1)
+        if not trusted:
+            fresh = _segment_digest(path, off, off + length, reader)
+            workspace_read(length)
+        if trusted or fresh == digest:
+            seg_agg = _fps_load_aggregate(state, kernels)
+            FPS_CACHE_STATS["segment_hits"] += 1
+        else:
+            seg_agg, digest = _fps_scan_segment(path, chunk_size, reader, kernels, off, off + length)
+            workspace_read(length)
+            state = aggregate_state(seg_agg)
+            FPS_CACHE_STATS["segment_misses"] += 1
+        segments.append([off, length, digest, state])
+        merge_reducers(agg, seg_agg)
+        offset = off + length
+        if on_chunk:
+            on_chunk(agg["chunks"].n)
+
+    for off in range(offset, st.st_size, seg_bytes):
+        end = min(off + seg_bytes, st.st_size)
+        seg_agg, digest = _fps_scan_segment(path, chunk_size, reader, kernels, off, end)
+        workspace_read(end - off)
+        segments.append([off, end - off, digest, aggregate_state(seg_agg)])
+        merge_reducers(agg, seg_agg)
+        FPS_CACHE_STATS["segment_misses"] += 1
+        if on_chunk:
+            on_chunk(agg["chunks"].n)
+        if time.monotonic() - last_save >= save_every:
+            save()  # doubles as a checkpoint: an unchanged file resumes from here
+            last_save = time.monotonic()
+
+    record["complete"] = True
+    save()
+    fps_cache_evict(keep=cfile)
+    return agg
+
+def _fps_range_worker(args):
+    # Runs in a pool worker: opens the file itself, so only offsets are pickled.
+    # io_share splits the tier's read rate between the concurrent workers and
+    # io_base is the parent's recorded usage; the parent records the range's
+    # bytes when it comes back, so nothing here touches the counters.
+    global _IO_SHARE, _IO_BASE
+    path, start, end, chunk_size, reader, kernels, io_share, io_base = args
+    _IO_SHARE, _IO_BASE = io_share, io_base
+    _IO_PENDING.update(day=_today_str(), read=0, write=0)
+    _IO_RATES.clear()
+    try:
+        return _fps_scan(path, chunk_size, reader, kernels, start, end)
+    finally:
+        _IO_SHARE, _IO_BASE = 1.0, None
+        _IO_PENDING.update(read=0, write=0)
+        _IO_RATES.clear()
+
+def _fps_collect(path, chunk_size, reader, workers, kernels, on_chunk=None, shared=False):
+    """FPS aggregate for the whole file, ranges merged in file order.
+
+    shared=True runs the ranges through the DPS scheduler instead of a private pool.
+    """
+    ranges = []
+    if workers > 1:
+        size = os.path.getsize(path)
+        parts = min(workers * 4, max(1, size // FPS_MIN_RANGE_BYTES))
+        ranges = split_line_ranges(path, parts)
+    if len(ranges) <= 1:
+        return _fps_scan(path, chunk_size, reader, kernels, on_chunk=on_chunk, record=True)
+    if chunk_size == "auto":
+        # each worker tunes its own chunks within its share of the RAM budget
+        chunk_size = ("auto", get_effective_resources()["processing_memory_mb"] / workers)
+    share = 1.0 / min(workers, len(ranges))
+    merge_counters()
+    wr = STATE["workspace"]["bytes_written_today"]
+    rd = STATE["workspace"]["bytes_read_today"]
+    # ranges ahead of one are (nearly) all read by the time it starts
+    jobs = [(path, s, e, chunk_size, reader, kernels, share, {"read": rd + s, "write": wr})
+            for s, e in ranges]
+    agg = fps_new_aggregate(kernels)
+    private = None if shared else Pool(processes=min(workers, len(jobs)))
+    try:
+        if private:
+            parts = private.imap(_fps_range_worker, jobs)
+        else:
+            # each range is far above the batching threshold, so it runs as its own task
+            futs = get_dps_scheduler().map(_fps_range_worker, jobs, cost=FPS_RANGE_COST_S)
+            parts = (f.result() for f in futs)
+        # parts come back in range order, so partial aggregates merge in file order
+        for part in parts:
+            workspace_read(part["bytes"].result())
+            merge_reducers(agg, part)
+            if on_chunk:
+                on_chunk(agg["chunks"].n)
+    finally:
+        if private:
+            private.terminate()
+    return agg
+
+def fps_summary(agg):
+    summary = {
+        "chunks": agg["chunks"].result(),
+        "bytes": agg["bytes"].result(),
+        "lines": agg["lines"].result(),
+        "avg_checksum": round(agg["checksum"].result(), 2),
+        "lines_per_chunk": agg["lines_per_chunk"].result(),
+        "chunk_bytes": agg["chunk_bytes"].result(),
+    }
+    if "kernels" in agg:
+        summary["kernels"] = agg["kernels"].result()
+    return summary
+
+def fps_run(path, chunk_size=4096, reader="zerocopy", parallel=False, workers=None,
+            kernels=None, checkpoint=False, checkpoint_every=FPS_CHECKPOINT_EVERY_S,
+            cache=False, progress_cb=None, append_only=False):
+    """Chunk and process a file without prompting; returns the summary dict.
+
+    With parallel=True the file is split on line boundaries and the ranges are
+    processed on the shared DPS pool, sized from the tier's cpu_priority (or
+    on a private pool of `workers` processes). `kernels` names extra chunk
+    kernels (see CHUNK_KERNELS) reported under "kernels".
+    Memory use does not grow with file size: chunks are folded into reducers.
+    With checkpoint=True (serial runs only) progress is saved every
+    `checkpoint_every` seconds and a re-run resumes from the saved offset.
+    chunk_size="auto" lets an AdaptiveChunker pick sizes as the job runs;
+    summary["chunk_bytes"] reports the sizes actually used.
+    cache=True (serial runs only) reuses stored segment results across runs;
+    its records are saved on the same interval, so it also resumes. Reused
+    segments are re-fingerprinted unless the file is unchanged; append_only=True
+    skips that for files that only ever grow (logs that are never rewritten).
+    Bytes read are recorded through workspace_read as the run goes (per range
+    for parallel runs), so they count toward the tier's daily I/O budget.
+    """
+    if reader not in FPS_READERS:
+        raise ValueError(f"Unknown FPS reader: {reader}")
+    kernels = tuple(kernels or ())
+    _check_kernels(kernels)
+    auto = chunk_size == "auto"
+    if cache and auto:
+        raise ValueError("The FPS result cache needs a fixed chunk_size")
+    shared = parallel and not workers
+    if parallel:
+        workers = workers or workers_for_priority()
+    else:
+        workers = 1
+    total_bytes = os.path.getsize(path)
+    est_chunks = None if auto else math.ceil(total_bytes / max(1, chunk_size))
+
+    def on_chunk(done):
+        if progress_cb:
+            try: progress_cb(done, est_chunks)
+            except Exception: pass
+
+    start = 0
+    if cache and workers <= 1:
+        agg = _fps_cached_scan(path, chunk_size, reader, kernels, on_chunk, checkpoint_every, append_only)
+    elif checkpoint and workers <= 1:
+        ckpt = FpsCheckpoint(path, chunk_size, kernels, checkpoint_every)
+        start, agg = ckpt.load()
+        agg = _fps_scan(path, chunk_size, reader, kernels, start, on_chunk=on_chunk,
+                        agg=agg, checkpoint=ckpt, record=True)
+        ckpt.clear()
+    else:
+        agg = _fps_collect(path, chunk_size, reader, workers, kernels, on_chunk, shared)
+    summary = fps_summary(agg)
+    summary["workers"] = workers
+    summary["chunk_size"] = chunk_size
+    if start:
+        summary["resumed_from"] = start
+    return summary
 
 def fps_chunk_and_process():
     print("=== FPS: Chunk & Process File ===")
@@ -62,46 +1271,1169 @@ def fps_chunk_and_process():
         print("File not found. Please provide a valid path.")
         return
 
+    sz = input("Chunk size in bytes or 'auto' (default auto): ").strip().lower()
     try:
-        sz = input("Chunk size in bytes (default 4096): ").strip()
-        chunk_size = int(sz) if sz else 4096
+        chunk_size = int(sz) if sz and sz != "auto" else "auto"
     except ValueError:
-        print("Invalid size, using 4096.")
-        chunk_size = 4096
+        print("Invalid size, using auto.")
+        chunk_size = "auto"
+
+    reader = input("Reader (zerocopy/stream, default zerocopy): ").strip().lower() or "zerocopy"
+    if reader not in FPS_READERS:
+        print("Unknown reader, using zerocopy.")
+        reader = "zerocopy"
+    parallel = input("Use all tier CPU workers? (y/N): ").strip().lower() in ("y", "yes")
+    cache = (not parallel and chunk_size != "auto"
+             and input("Reuse cached results? (Y/n): ").strip().lower() not in ("n", "no"))
+    print(f"Kernels: {', '.join(CHUNK_KERNELS)}")
+    names = [k.strip() for k in input("Extra kernels (comma-separated, blank for none): ").split(",") if k.strip()]
+    kernels = [k for k in names if k in CHUNK_KERNELS]
+    if len(kernels) != len(names):
+        print("Skipping unknown kernels.")
 
     total_bytes = os.path.getsize(path)
-    est_chunks = math.ceil(total_bytes / max(1, chunk_size))
-    print(f"File size: {total_bytes} bytes, estimated chunks: {est_chunks}")
+    if chunk_size == "auto":
+        print(f"File size: {total_bytes} bytes, chunk size picked automatically")
+    else:
+        est_chunks = math.ceil(total_bytes / max(1, chunk_size))
+        print(f"File size: {total_bytes} bytes, estimated chunks: {est_chunks}")
+
+    shown = [0]
+    def progress(idx, total):
+        if idx - shown[0] >= 10 or idx == total:
+            shown[0] = idx
+            print(f"Processed {idx}/{total} chunks..." if total else f"Processed {idx} chunks...")
 
-    results = []
     try:
-        for idx, chunk in enumerate(read_in_chunks(path, chunk_size), start=1):
-            res = process_chunk(chunk)
-            results.append(res)
-            if idx % 10 == 0 or idx == est_chunks:
-                print(f"Processed {idx}/{est_chunks} chunks...")
-        add_credits(min(5, est_chunks))
+        summary = fps_run(path, chunk_size, reader=reader, parallel=parallel,
+                         kernels=kernels, checkpoint=not parallel, cache=cache,
+                         progress_cb=progress)
+        add_credits(min(5, summary["chunks"]))
         print("FPS completed. Summary:")
-        total_b = sum(r["bytes"] for r in results)
-        total_l = sum(r["lines"] for r in results)
-        avg_cs = round(sum(r["checksum"] for r in results) / max(1, len(results)), 2)
-        print(f"- Total bytes seen: {total_b}")
-        print(f"- Total lines counted: {total_l}")
-        print(f"- Avg checksum: {avg_cs}")
+        if summary.get("resumed_from"):
+            print(f"- Resumed from byte {summary['resumed_from']}")
+        if summary["workers"] > 1:
+            print(f"- Workers used: {summary['workers']}")
+        print(f"- Total bytes seen: {summary['bytes']}")
+        print(f"- Total lines counted: {summary['lines']}")
+        print(f"- Avg checksum: {summary['avg_checksum']}")
+        cb = summary["chunk_bytes"]
+        if summary["chunk_size"] == "auto":
+            print(f"- Chunk sizes used: min {cb['min']}, p50 {round(cb['p50'] or 0)}, max {cb['max']} bytes")
+        lpc = summary["lines_per_chunk"]
+        print(f"- Lines per chunk: min {lpc['min']}, p50 {lpc['p50']}, p99 {lpc['p99']}, max {lpc['max']}")
+        for name, value in summary.get("kernels", {}).items():
+            if name == "histogram":
+                value = {i: c for i, c in enumerate(value) if c}
+            print(f"- {name}: {value}")
+        if cache:
+            cs = fps_cache_stats()
+            print(f"- Cache: {cs['segment_hits']} segment hits, {cs['segment_misses']} misses "
+                  f"(file hit ratio {cs['file_hit_ratio']})")
+    except KeyboardInterrupt:
+        if parallel:
+            print("Stopped by user. Parallel runs are not checkpointed.")
+        else:
+            print("Paused by user. Progress saved at the last checkpoint; run again to resume.")
+
+# --- FPS batch mode ---
+FPS_BATCH_THREADS = 8       # files in flight at once (I/O bound, so threads)
+FPS_BATCH_FLUSH_FILES = 64  # report bytes read to the workspace every N files
+
+def expand_fps_targets(target, pattern="*"):
+    """Files under a directory (recursive, matching pattern) or matching a glob."""
+    if os.path.isdir(target):
+        found = []
+        for root, _, names in os.walk(target):
+            found.extend(os.path.join(root, n) for n in names if fnmatch.fnmatch(n, pattern))
+    else:
+        found = glob.glob(target, recursive=True)
+    return sorted(p for p in found if os.path.isfile(p))
+
+def _fps_batch_file(args):
+    path, chunk_size, reader, kernels = args
+    try:
+        return path, _fps_scan(path, chunk_size, reader, kernels), None
+    except OSError as e:
+        return path, None, str(e)
+
+def fps_batch(target, pattern="*", chunk_size=64 * 1024, reader="zerocopy", kernels=None,
+              threads=FPS_BATCH_THREADS, progress_cb=None):
+    """Run FPS over many files concurrently; returns per-file and overall summaries.
+
+    Files are processed by a thread pool so open/stat latency overlaps. The
+    overall aggregate merges files in path order, and bytes read are recorded
+    via workspace_read every FPS_BATCH_FLUSH_FILES files instead of per file.
+    """
+    if reader not in FPS_READERS:
+        raise ValueError(f"Unknown FPS reader: {reader}")
+    kernels = tuple(kernels or ())
+    _check_kernels(kernels)
+    paths = expand_fps_targets(target, pattern)
+    total = fps_new_aggregate(kernels)
+    files, errors = [], []
+    pending, since_flush = 0, 0
+    t0 = time.perf_counter()
+    jobs = [(p, chunk_size, reader, kernels) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as ex:
+        # map yields in submission order while files are read concurrently
+        for idx, (path, agg, err) in enumerate(ex.map(_fps_batch_file, jobs), start=1):
+            if err:
+                errors.append({"path": path, "error": err})
+            else:
+                summary = fps_summary(agg)
+                summary["path"] = path
+                files.append(summary)
+                pending += summary["bytes"]
+                merge_reducers(total, agg)
+            since_flush += 1
+            if since_flush >= FPS_BATCH_FLUSH_FILES:
+                workspace_read(pending)
+                pending, since_flush = 0, 0
+            if progress_cb:
+                try: progress_cb(idx, len(paths))
+                except Exception: pass
+    if pending:
+        workspace_read(pending)
+    if files:
+        add_credits(min(5, len(files)))
+    overall = fps_summary(total)
+    overall["files"] = len(files)
+    overall["seconds"] = round(time.perf_counter() - t0, 3)
+    return {"files": files, "errors": errors, "overall": overall}
+
+def fps_batch_process():
+    print("=== FPS: Batch Process Files ===")
+    print("Enter a directory or glob (e.g. logs/**/*.log). Type 'back' to return.")
+    target = input("Target: ").strip()
+    if target.lower() in ("back", "exit", "quit"):
+        print("Returning...")
+        return
+    pattern = "*"
+    if os.path.isdir(target):
+        pattern = input("File pattern (default *): ").strip() or "*"
+    shown = [0]
+    def progress(idx, total):
+        if idx - shown[0] >= 50 or idx == total:
+            shown[0] = idx
+            print(f"Processed {idx}/{total} files...")
+    try:
+        res = fps_batch(target, pattern, progress_cb=progress)
+    except KeyboardInterrupt:
+        print("Stopped by user.")
+        return
+    ov = res["overall"]
+    if not ov["files"] and not res["errors"]:
+        print("No files matched.")
+        return
+    print("FPS batch completed. Summary:")
+    for f in res["files"][:10]:
+        print(f"- {f['path']}: {f['bytes']} bytes, {f['lines']} lines")
+    if len(res["files"]) > 10:
+        print(f"- ... and {len(res['files']) - 10} more files")
+    for e in res["errors"]:
+        print(f"- {e['path']}: error {e['error']}")
+    print(f"- Files: {ov['files']}, bytes: {ov['bytes']}, lines: {ov['lines']}, time: {ov['seconds']}s")
+
+# --- FPS transform pipeline ---
+# Transforms turn input chunks into output bytes: feed(chunk) -> bytes and a
+# final flush() -> bytes. Chunks are reused buffers, so feed must not keep them.
+
+class _CopyTransform:
+    def feed(self, chunk):
+        return bytes(chunk)
+    def flush(self):
+        return b""
+
+class _CompressTransform:
+    def __init__(self, compressor):
+        self.comp = compressor
+    def feed(self, chunk):
+        return self.comp.compress(chunk)
+    def flush(self):
+        return self.comp.flush()
+
+class _LineFilterTransform:
+    """Keep (or drop, with keep=False) lines containing `needle`."""
+    def __init__(self, needle, keep=True):
+        self.needle, self.keep = needle, keep
+        self.carry = b""
+    def _select(self, lines):
+        return [ln for ln in lines if (self.needle in ln) == self.keep]
+    def feed(self, chunk):
+        lines = (self.carry + bytes(chunk)).split(b"\n")
+        self.carry = lines.pop()
+        keep = self._select(lines)
+        return b"\n".join(keep) + b"\n" if keep else b""
+    def flush(self):
+        tail, self.carry = self.carry, b""
+        return b"".join(self._select([tail])) if tail else b""
+
+class _ReencodeTransform:
+    # incremental on both sides: a BOM-writing codec (utf-16, utf-8-sig) emits it once
+    def __init__(self, src, dst):
+        self.dec = codecs.getincrementaldecoder(src)(errors="replace")
+        self.enc = codecs.getincrementalencoder(dst)(errors="replace")
+    def feed(self, chunk):
+        return self.enc.encode(self.dec.decode(chunk))
+    def flush(self):
+        return self.enc.encode(self.dec.decode(b"", final=True), final=True)
+
+def make_transform(spec):
+    """Build a transform from a spec string.
+
+    copy | zlib[:level] | lzma[:preset] | filter:<text> | exclude:<text> |
+    reencode:<from>:<to>
+    """
+    name, _, arg = spec.partition(":")
+    name = name.strip().lower()
+    if name == "copy":
+        return _CopyTransform()
+    if name == "zlib":
+        return _CompressTransform(zlib.compressobj(int(arg) if arg else 6))
+    if name == "lzma":
+        return _CompressTransform(lzma.LZMACompressor(preset=int(arg) if arg else 6))
+    if name in ("filter", "exclude") and arg:
+        return _LineFilterTransform(arg.encode("utf-8"), keep=(name == "filter"))
+    if name == "reencode" and ":" in arg:
+        src, _, dst = arg.partition(":")
+        return _ReencodeTransform(src, dst)
+    raise ValueError(f"Unknown transform: {spec}")
+
+def fps_transform(src, dst, transform="copy", chunk_size=256 * 1024, buffers=4):
+    """Read, transform and write a file with the three stages overlapped.
+
+    A reader thread fills a fixed set of reused buffers, the calling thread
+    transforms them, and a writer thread drains the output. The stages talk
+    through bounded queues. Each stage's busy time is reported so the
+    bottleneck is visible. Bytes written are recorded via workspace_write.
+    """
+    tr = make_transform(transform) if isinstance(transform, str) else transform
+    buffers = max(2, buffers)
+    free, full, out = queue.Queue(), queue.Queue(maxsize=buffers), queue.Queue(maxsize=buffers)
+    for _ in range(buffers):
+        free.put(bytearray(max(1, chunk_size)))
+    busy = {"read": 0.0, "transform": 0.0, "write": 0.0}
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            with open(src, "rb") as f:
+                while not stop.is_set():
+                    buf = free.get()
+                    if buf is None:
+                        break
+                    t = time.perf_counter()
+                    n = f.readinto(buf)
+                    busy["read"] += time.perf_counter() - t
+                    if not n:
+                        break
+                    throttle_io("read", n)
+                    full.put((buf, n))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            full.put(None)
+
+    def writer():
+        try:
+            with open(dst, "wb") as f:
+                while True:
+                    data = out.get()
+                    if data is None:
+                        return
+                    throttle_io("write", len(data))
+                    t = time.perf_counter()
+                    f.write(data)
+                    busy["write"] += time.perf_counter() - t
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+            while out.get() is not None:  # keep draining so the transform never blocks
+                pass
+
+    t0 = time.perf_counter()
+    rt = threading.Thread(target=reader, daemon=True)
+    wt = threading.Thread(target=writer, daemon=True)
+    rt.start()
+    wt.start()
+    read = written = 0
+    try:
+        while True:
+            item = full.get()
+            if item is None:
+                break
+            buf, n = item
+            read += n
+            if not stop.is_set():
+                with memoryview(buf) as mv:
+                    piece = mv[:n]
+                    t = time.perf_counter()
+                    data = tr.feed(piece)
+                    busy["transform"] += time.perf_counter() - t
+                    piece.release()
+                if data:
+                    out.put(data)
+                    written += len(data)
+            free.put(buf)
+        if not stop.is_set():
+            t = time.perf_counter()
+            data = tr.flush()
+            busy["transform"] += time.perf_counter() - t
+            if data:
+                out.put(data)
+                written += len(data)
+    finally:
+        stop.set()
+        free.put(None)  # unblock the reader if it is waiting for a buffer
+        while rt.is_alive():
+            try:
+                item = full.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is not None:
+                free.put(item[0])
+        out.put(None)
+        wt.join()
+    if errors:
+        raise errors[0]
+    workspace_read(read)
+    workspace_write(written)
+    wall = max(time.perf_counter() - t0, 1e-9)
+    stages = {k: {"busy_s": round(v, 4), "busy_pct": round(100 * v / wall, 1)} for k, v in busy.items()}
+    return {"read": read, "written": written, "seconds": round(wall, 4),
+            "stages": stages, "bottleneck": max(busy, key=busy.get)}
+
+def fps_transform_process():
+    print("=== FPS: Transform File ===")
+    print("Transforms: copy, zlib[:level], lzma[:preset], filter:<text>, exclude:<text>, reencode:<from>:<to>")
+    src = input("Source path: ").strip()
+    if src.lower() in ("back", "exit", "quit"):
+        print("Returning...")
+        return
+    if not os.path.isfile(src):
+        print("File not found. Please provide a valid path.")
+        return
+    dst = input("Output path: ").strip()
+    if not dst or os.path.abspath(dst) == os.path.abspath(src):
+        print("Please give a different output path.")
+        return
+    spec = input("Transform (default zlib): ").strip() or "zlib"
+    try:
+        res = fps_transform(src, dst, spec)
+    except ValueError as e:
+        print(e)
+        return
     except KeyboardInterrupt:
-        print("Paused by user. Partial progress retained. Resume anytime.")
+        print("Stopped by user. Output is incomplete.")
+        return
+    add_credits(min(5, 1 + res["read"] // (1024 * 1024)))
+    print("FPS transform completed. Summary:")
+    print(f"- Read {res['read']} bytes, wrote {res['written']} bytes in {res['seconds']}s")
+    for name, st in res["stages"].items():
+        print(f"- {name}: busy {st['busy_pct']}%")
+    print(f"- Bottleneck: {res['bottleneck']}")
+
+# --- FPS digests and duplicate detection ---
+# Tree digests: leaves are H(0x00 || leaf bytes), parents H(0x01 || left || right),
+# an odd node is promoted unchanged. hashlib releases the GIL on large
+# buffers, so leaf ranges hashed on threads run on separate cores.
+FPS_DIGEST_LEAF_BYTES = 1024 * 1024
+FPS_DIGEST_ALGOS = ("blake2b", "sha256")
+
+def _new_hash(algo):
+    if algo not in FPS_DIGEST_ALGOS:
+        raise ValueError(f"Unknown digest algorithm: {algo}")
+    return hashlib.blake2b(digest_size=32) if algo == "blake2b" else hashlib.sha256()
+
+def _hash_leaves(args):
+    path, algo, leaf_size, first, last = args
+    out = []
+    buf = bytearray(leaf_size)
+    with memoryview(buf) as view, open(path, "rb") as f:
+        f.seek(first * leaf_size)
+        for _ in range(first, last):
+            n = f.readinto(buf)
+            throttle_io("read", n)
+            h = _new_hash(algo)
+            h.update(b"\x00")
+            with view[:n] as piece:
+                h.update(piece)
+            out.append(h.digest())
+    return out
+
+def _merkle_root(nodes, algo):
+    while len(nodes) > 1:
+        nxt = []
+        for i in range(0, len(nodes) - 1, 2):
+            h = _new_hash(algo)
+            h.update(b"\x01")
+            h.update(nodes[i])
+            h.update(nodes[i + 1])
+            nxt.append(h.digest())
+        if len(nodes) % 2:
+            nxt.append(nodes[-1])
+        nodes = nxt
+    return nodes[0]
+
+def _tree_digest(path, algo, leaf_size, workers):
+    size = os.path.getsize(path)
+    leaves = max(1, math.ceil(size / leaf_size))
+    groups = min(leaves, max(1, workers) * 4)
+    bounds = [leaves * i // groups for i in range(groups + 1)]
+    jobs = [(path, algo, leaf_size, a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+    if len(jobs) == 1 or workers <= 1:
+        parts = [_hash_leaves(j) for j in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_hash_leaves, jobs))
+    return _merkle_root([d for part in parts for d in part], algo).hex(), leaves, size
+
+def fps_digest(path, algo="blake2b", leaf_size=FPS_DIGEST_LEAF_BYTES, workers=None):
+    """Strong tree digest of a file, leaves hashed in parallel (tier-sized workers)."""
+    workers = workers or workers_for_priority()
+    digest, leaves, size = _tree_digest(path, algo, leaf_size, workers)
+    workspace_read(size)
+    return {"path": path, "algo": algo, "leaf_size": leaf_size, "leaves": leaves,
+            "bytes": size, "digest": digest}
+
+def _partial_hash(args):
+    path, algo, size, edge = args
+    h = _new_hash(algo)
+    with open(path, "rb") as f:
+        h.update(f.read(edge))
+        if size > edge:
+            f.seek(max(edge, size - edge))
+            h.update(f.read(edge))
+    throttle_io("read", min(size, 2 * edge))
+    return h.hexdigest()
+
+def find_duplicates(target, pattern="*", algo="blake2b", partial_bytes=64 * 1024, workers=None):
+    """Groups of identical files under a directory or glob.
+
+    Candidates are narrowed by size, then by a hash of each file's first and
+    last `partial_bytes`; only files that still collide get a full tree digest.
+    """
+    workers = workers or workers_for_priority()
+    by_size = {}
+    for p in expand_fps_targets(target, pattern):
+        try:
+            by_size.setdefault(os.path.getsize(p), []).append(p)
+        except OSError:
+            pass
+    stats = {"files": sum(len(v) for v in by_size.values()), "partial_hashed": 0,
+             "full_hashed": 0, "bytes_read": 0}
+    candidates = [(size, paths) for size, paths in by_size.items() if len(paths) > 1]
+    groups = []
+    with ThreadPoolExecutor(max_workers=max(1, workers) * 2) as ex:
+        for size, paths in candidates:
+            if size == 0:
+                groups.append(paths)
+                continue
+            partial = {}
+            jobs = [(p, algo, size, partial_bytes) for p in paths]
+            for p, h in zip(paths, ex.map(_partial_hash, jobs)):
+                partial.setdefault(h, []).append(p)
+            stats["partial_hashed"] += len(paths)
+            stats["bytes_read"] += len(paths) * min(size, 2 * partial_bytes)
+            for same in partial.values():
+                if len(same) < 2:
+                    continue
+                if size <= 2 * partial_bytes:
+                    groups.append(same)  # the partial hash already covered every byte
+                    continue
+                full = {}
+                for p in same:
+                    full.setdefault(_tree_digest(p, algo, FPS_DIGEST_LEAF_BYTES, workers)[0], []).append(p)
+                stats["full_hashed"] += len(same)
+                stats["bytes_read"] += len(same) * size
+                groups.extend(g for g in full.values() if len(g) > 1)
+    if stats["bytes_read"]:
+        workspace_read(stats["bytes_read"])
+    return {"groups": sorted(sorted(g) for g in groups), "stats": stats}
+
+def fps_digest_process():
+    print("=== FPS: Digest / Find Duplicates ===")
+    print("Enter a file to digest, or a directory/glob to search for duplicates.")
+    target = input("Target: ").strip()
+    if target.lower() in ("back", "exit", "quit"):
+        print("Returning...")
+        return
+    algo = input("Algorithm (blake2b/sha256, default blake2b): ").strip().lower() or "blake2b"
+    if algo not in FPS_DIGEST_ALGOS:
+        print("Unknown algorithm, using blake2b.")
+        algo = "blake2b"
+    try:
+        if os.path.isfile(target):
+            res = fps_digest(target, algo)
+            print(f"{algo} tree digest ({res['leaves']} leaves): {res['digest']}")
+            return
+        res = find_duplicates(target, algo=algo)
+    except KeyboardInterrupt:
+        print("Stopped by user.")
+        return
+    st = res["stats"]
+    print(f"Scanned {st['files']} files: {st['partial_hashed']} partially hashed, "
+          f"{st['full_hashed']} fully hashed.")
+    if not res["groups"]:
+        print("No duplicates found.")
+    for g in res["groups"]:
+        print("- Duplicates: " + ", ".join(g))
 
 # =========================
 # DPS: Distributed Processing (Simulation via Multiprocessing)
 # =========================
 
+HEAVY_STEPS, HEAVY_MOD = 5000, 1000003
+
 def heavy_compute(x):
     # Simulate heavy CPU work per unit of data (tuned for mobile safety)
     s = 0
-    for i in range(5000):
-        s = (s + (x * i)) % 1000003
+    for i in range(HEAVY_STEPS):
+        s = (s + (x * i)) % HEAVY_MOD
     return s
 
+# --- Batch compute engine ---
+# heavy_compute adds x*i for i < HEAVY_STEPS modulo HEAVY_MOD, which is
+# x * sum(range(HEAVY_STEPS)) mod HEAVY_MOD; reducing x first keeps every
+# product below 2**63, so the NumPy path is exact in int64.
+_HEAVY_FACTOR = (HEAVY_STEPS * (HEAVY_STEPS - 1) // 2) % HEAVY_MOD
+
+def heavy_compute_fast(x):
+    """Closed form of heavy_compute for one input (same result, O(1))."""
+    return (x % HEAVY_MOD) * _HEAVY_FACTOR % HEAVY_MOD
+
+def heavy_compute_batch(xs, backend=None):
+    """heavy_compute over many inputs in one call.
+
+    Returns a NumPy int64 array on the numpy backend, otherwise a list.
+    Inputs that do not fit int64 use the scalar path.
+    """
+    if _use_numpy(backend):
+        try:
+            arr = np.asarray(xs, dtype=np.int64)
+        except OverflowError:
+            arr = None
+        if arr is not None:
+            return (arr % HEAVY_MOD) * _HEAVY_FACTOR % HEAVY_MOD
+    return [heavy_compute_fast(x) for x in xs]
+
+def stress_accumulate(iterations, steps):
+    """Closed form of stress_compute's loop result."""
+    chunk = max(1, iterations // steps)
+    return steps * (chunk * (chunk - 1) // 2) % HEAVY_MOD
+
+DPS_BATCH_BLOCK_UNITS = 250000  # most inputs per block handed to one worker
+
+def _heavy_block(bounds):
+    start, stop = bounds
+    xs = np.arange(start, stop, dtype=np.int64) if _use_numpy() else range(start, stop)
+    return start, heavy_compute_batch(xs)
+
+def dps_heavy_batched(n, progress_cb=None, sample=5):
+    """heavy_compute over 1..n in vectorized blocks on the DPS pool.
+
+    Workers only receive (start, stop) bounds. The summary has the same
+    shape as dps_run's.
+    """
+    n = min(n, dps_unit_cap())
+    workers = dps_pool_info()["workers"] or workers_for_priority()
+    block = max(1, min(DPS_BATCH_BLOCK_UNITS, math.ceil(n / (workers * 4))))
+    blocks = [(a, min(a + block, n + 1)) for a in range(1, n + 1, block)]
+    # each block holds a few int64 arrays of its size while being computed
+    block_mb = block * 8 * 4 / (1024 * 1024)
+    head, tail, done = {}, {}, 0
+    t0 = time.perf_counter()
+    first_s = None
+    pool, gate = get_dps_pool(), _DPS_GATE
+    for start, out in _dps_admitted(pool, _heavy_block, blocks, gate, block_mb):
+        if first_s is None:
+            first_s = time.perf_counter() - t0
+        cnt = len(out)
+        for k in range(min(cnt, max(0, sample - (start - 1)))):
+            head[start + k] = int(out[k])
+        for k in range(max(0, n - sample + 1 - start), cnt):
+            tail[start + k] = int(out[k])
+        done += cnt
+        if progress_cb:
+            try: progress_cb(done, n)
+            except Exception: pass
+    return {"units": done, "first": [head[i] for i in sorted(head)], "last": [tail[i] for i in sorted(tail)],
+            "first_result_s": round(first_s or 0.0, 4), "seconds": round(time.perf_counter() - t0, 4)}
+
+# --- Shared DPS worker pool ---
+# One long-lived pool for the CLI, the UI's threaded runs and batch jobs, so
+# each run skips process start-up and module import. It is created on first
+# use, rebuilt when the tier's worker count changes, recycles each worker
+# after DPS_MAX_TASKS_PER_CHILD tasks and is shut down at exit.
+DPS_MAX_TASKS_PER_CHILD = 200
+_DPS_POOL = None
+_DPS_POOL_KEY = None
+_DPS_GATE = None
+_DPS_POOL_LOCK = threading.Lock()
+
+def _dps_worker_init(nice, cores):
+    # Runs in each worker: lower its priority and pin it (best effort per OS)
+    if nice:
+        try: os.nice(nice)
+        except (AttributeError, OSError): pass
+    if cores:
+        try: os.sched_setaffinity(0, cores)
+        except (AttributeError, OSError): pass
+
+class AdmissionGate:
+    """Memory budget (MB) for DPS work in flight.
+
+    acquire() blocks while the budget is used up, so excess work waits in
+    the queue instead of piling into workers. A task larger than the whole
+    budget is still admitted when nothing else is running.
+    """
+    def __init__(self, capacity_mb):
+        self.capacity = max(1.0, float(capacity_mb))
+        self.in_use = 0.0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, mb):
+        with self._cond:
+            if self.in_use and self.in_use + mb > self.capacity:
+                self.waits += 1
+                while self.in_use and self.in_use + mb > self.capacity:
+                    self._cond.wait()
+            self.in_use += mb
+
+    def release(self, mb):
+        with self._cond:
+            self.in_use = max(0.0, self.in_use - mb)
+            self._cond.notify_all()
+
+    def slots(self, mb):
+        """Tasks of this size that fit in the budget at once (at least 1)."""
+        return max(1, int(self.capacity // max(mb, 1e-9)))
+
+def get_dps_pool():
+    global _DPS_POOL, _DPS_POOL_KEY, _DPS_GATE
+    res = get_effective_resources()
+    priority, ram_mb = res["cpu_priority"], res["processing_memory_mb"]
+    workers = workers_for_priority(priority, ram_mb)
+    key = (priority, workers, ram_mb)
+    with _DPS_POOL_LOCK:
+        if _DPS_POOL is not None and _DPS_POOL_KEY != key:
+            old, _DPS_POOL = _DPS_POOL, None
+            old.close()  # running tasks finish; join off-thread so callers don't wait
+            threading.Thread(target=old.join, daemon=True).start()
+        if _DPS_POOL is None:
+            prof = cpu_profile(priority)
+            cores = _allowed_cores()[:prof["cores"]] if prof["cores"] else None
+            _DPS_POOL = Pool(processes=workers, maxtasksperchild=DPS_MAX_TASKS_PER_CHILD,
+                             initializer=_dps_worker_init, initargs=(prof["nice"], cores))
+            _DPS_POOL_KEY = key
+            # whatever the worker processes themselves don't use is for data in flight
+            _DPS_GATE = AdmissionGate(ram_mb - workers * DPS_WORKER_MB)
+        return _DPS_POOL
+
+def dps_gate():
+    """The admission gate that belongs to the current shared pool."""
+    get_dps_pool()
+    return _DPS_GATE
+
+def _dps_admit(items, gate, unit_mb, run):
+    # Feeds the pool's task handler; blocks there while the budget is used up.
+    # run["held"] counts admitted units not yet released; run["stop"] ends feeding.
+    for item in items:
+        gate.acquire(unit_mb)
+        if run["stop"]:
+            gate.release(unit_mb)
+            return
+        run["held"] += 1
+        yield item
+
+def _dps_admitted(pool, fn, items, gate, unit_mb, chunksize=1):
+    """imap_unordered over items, admitting each against the gate."""
+    run = {"held": 0, "stop": False}
+    try:
+        for out in pool.imap_unordered(fn, _dps_admit(items, gate, unit_mb, run), chunksize=chunksize):
+            run["held"] -= 1
+            gate.release(unit_mb)
+            yield out
+    finally:
+        # consumer stopped early: stop feeding and hand back what this run still holds
+        run["stop"] = True
+        gate.release(run["held"] * unit_mb)
+
+def dps_pool_info():
+    with _DPS_POOL_LOCK:
+        if _DPS_POOL is None:
+            return {"running": False, "workers": 0, "cpu_priority": None}
+        prof = cpu_profile(_DPS_POOL_KEY[0])
+        return {"running": True, "workers": _DPS_POOL_KEY[1], "cpu_priority": _DPS_POOL_KEY[0],
+                "nice": prof["nice"], "cores": prof["cores"],
+                "admission_mb": _DPS_GATE.capacity, "in_flight_mb": _DPS_GATE.in_use,
+                "admission_waits": _DPS_GATE.waits}
+
+def shutdown_dps_pool(wait=True):
+    global _DPS_POOL, _DPS_POOL_KEY
+    with _DPS_POOL_LOCK:
+        pool, _DPS_POOL, _DPS_POOL_KEY = _DPS_POOL, None, None
+    if pool is None:
+        return
+    if wait:
+        pool.close()
+        pool.join()
+    else:
+        pool.terminate()
+
+atexit.register(shutdown_dps_pool)
+
+# --- DPS memoization ---
+# Registered pure kernels are looked up here before anything is sent to the
+# pool: an in-process LRU, optionally backed by a sqlite store that other
+# processes (and later runs) share.
+DPS_MEMO_ENTRIES = 100000
+DPS_MEMO_DB = ".lde_memo.sqlite"
+DPS_MEMO_SLICE = 4096  # inputs looked up (and at most one task batch) at a time while streaming
+PURE_KERNELS = {}  # function -> cache name (kernels with equal results may share one)
+
+def register_pure_kernel(fn, name=None):
+    PURE_KERNELS[fn] = name or fn.__name__
+    return fn
+
+register_pure_kernel(heavy_compute)
+register_pure_kernel(heavy_compute_fast, "heavy_compute")
+
+class KernelMemo:
+    def __init__(self, entries=DPS_MEMO_ENTRIES, db_path=None):
+        self.entries = entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS memo (kernel TEXT, arg TEXT, value TEXT, "
+                             "PRIMARY KEY (kernel, arg)) WITHOUT ROWID")
+            self._db.commit()
+
+    def lookup(self, name, xs):
+        """{position: value} for the xs already known; the rest count as misses."""
+        found, cold = {}, []
+        with self._lock:
+            for pos, x in enumerate(xs):
+                try:
+                    v = self._lru[(name, x)]
+                except (KeyError, TypeError):
+                    cold.append(pos)
+                    continue
+                self._lru.move_to_end((name, x))
+                found[pos] = v
+            self.stats["memory_hits"] += len(found)
+            if self._db is not None and cold:
+                keys = {json.dumps(xs[pos]): pos for pos in cold}
+                args = list(keys)
+                for i in range(0, len(args), 500):
+                    part = args[i:i + 500]
+                    q = "SELECT arg, value FROM memo WHERE kernel = ? AND arg IN (%s)" % ",".join("?" * len(part))
+                    for arg, value in self._db.execute(q, [name] + part):
+                        pos = keys[arg]
+                        found[pos] = json.loads(value)
+                        self._remember(name, xs[pos], found[pos])
+                        self.stats["disk_hits"] += 1
+            self.stats["misses"] += len(xs) - len(found)
+        return found
+
+    def store(self, name, pairs):
+        """Remember (x, value) pairs; values must be JSON-serializable for the disk store."""
+        with self._lock:
+            for x, v in pairs:
+                try:
+                    self._remember(name, x, v)
+                except TypeError:
+                    pass  # unhashable input: not cacheable
+            self.stats["stores"] += len(pairs)
+            if self._db is not None and pairs:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?)",
+                                         [(name, json.dumps(x), json.dumps(v)) for x, v in pairs])
+                    self._db.commit()
+                except (TypeError, ValueError, sqlite3.Error):
+                    pass
+
+    def _remember(self, name, x, v):
+        self._lru[(name, x)] = v
+        self._lru.move_to_end((name, x))
+        if len(self._lru) > self.entries:
+            self._lru.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM memo")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+_DPS_MEMO = KernelMemo()
+
+def configure_dps_memo(entries=DPS_MEMO_ENTRIES, disk=False, db_path=DPS_MEMO_DB):
+    """Replace the memo (e.g. to turn the shared on-disk store on or off)."""
+    global _DPS_MEMO
+    old, _DPS_MEMO = _DPS_MEMO, KernelMemo(entries, db_path if disk else None)
+    old.close()
+    return _DPS_MEMO
+
+def dps_memo_stats():
+    st = dict(_DPS_MEMO.stats)
+    hits = st["memory_hits"] + st["disk_hits"]
+    looked = hits + st["misses"]
+    st["entries"] = len(_DPS_MEMO._lru)
+    st["disk"] = _DPS_MEMO._db is not None
+    st["hit_ratio"] = round(hits / looked, 3) if looked else 0.0
+    st["memory_hit_ratio"] = round(st["memory_hits"] / looked, 3) if looked else 0.0
+    return st
+
+# --- Streaming DPS scheduling ---
+DPS_TARGET_BATCH_S = 0.05  # aim for ~50 ms of work per task batch sent to a worker
+DPS_UNIT_MB = 0.25         # assumed memory held by one scalar unit while in flight
+
+def _dps_indexed(fn, item):
+    i, x = item
+    return i, fn(x)
+
+def dps_chunksize(unit_cost_s, n, workers):
+    """Batch size so one batch costs about DPS_TARGET_BATCH_S, keeping every worker fed."""
+    by_cost = int(DPS_TARGET_BATCH_S / max(unit_cost_s, 1e-7))
+    by_balance = max(1, n // (max(1, workers) * 4))
+    return max(1, min(by_cost, by_balance))
+
+def dps_unit_cap():
+    return get_effective_resources()["dps_max_units"]
+
+def dps_stream(fn, items, chunksize=None, unit_mb=DPS_UNIT_MB):
+    """Yield (index, result) pairs as soon as workers finish them (any order).
+
+    The input is cut to the tier's dps_max_units. Without an explicit
+    chunksize the first unit is timed in-process (its result is yielded
+    first) and the batch size is derived from that per-unit cost. Units
+    are admitted against the tier's RAM budget (unit_mb each) and wait in
+    the queue while it is used up. For registered pure kernels, inputs are
+    checked against the memo a slice at a time as the stream goes; hits
+    are yielded right away and never reach the pool.
+    """
+    cap = dps_unit_cap()
+    try:
+        n = min(len(items), cap)
+    except TypeError:
+        items = list(islice(items, cap))
+        n = len(items)
+    if not n:
+        return
+    name, memo = PURE_KERNELS.get(fn), _DPS_MEMO
+    if name is None:
+        it = enumerate(islice(items, n))
+        yield from _dps_compute(fn, it, n, chunksize, unit_mb)
+        return
+    # Look up DPS_MEMO_SLICE inputs at a time; each slice's misses go on a
+    # feed queue that the pool's task handler drains, so hits and fresh
+    # results interleave and only about two slices are held here at once.
+    src, feed = iter(islice(items, n)), queue.Queue()
+    misses = (item for part in iter(feed.get, None) for item in part)
+    results = _dps_compute(fn, misses, n, chunksize, unit_mb, DPS_MEMO_SLICE)
+    pending, fresh = {}, []  # pending: index -> input still out in the pool
+    try:
+        for start in range(0, n, DPS_MEMO_SLICE):
+            xs = list(islice(src, DPS_MEMO_SLICE))
+            found = memo.lookup(name, xs)
+            part = []
+            for j, x in enumerate(xs):
+                if j in found:
+                    yield start + j, found[j]
+                else:
+                    pending[start + j] = x
+                    part.append((start + j, x))
+            if part:
+                feed.put(part)
+            # more than one slice outstanding means a full task batch is always queued
+            for i, res in islice(results, max(0, len(pending) - DPS_MEMO_SLICE)):
+                fresh.append((pending.pop(i), res))
+                yield i, res
+            if len(fresh) >= DPS_MEMO_SLICE:
+                memo.store(name, fresh)
+                fresh = []
+        feed.put(None)
+        for i, res in islice(results, len(pending)):
+            fresh.append((pending.pop(i), res))
+            yield i, res
+    finally:
+        feed.put(None)  # unblock the task handler if the consumer stopped early
+        results.close()
+        memo.store(name, fresh)
+
+def _dps_compute(fn, it, n, chunksize, unit_mb, max_chunk=None):
+    if not n:
+        return
+    pool, gate = get_dps_pool(), _DPS_GATE
+    if chunksize is None:
+        i, x = next(it)
+        t = time.perf_counter()
+        res = fn(x)
+        chunksize = dps_chunksize(time.perf_counter() - t, n - 1, dps_pool_info()["workers"])
+        yield i, res
+    # a batch must fit in the budget, or the handler could block on a batch it never sends
+    chunksize = min(chunksize, gate.slots(unit_mb), max_chunk or chunksize)
+    yield from _dps_admitted(pool, partial(_dps_indexed, fn), it, gate, unit_mb, chunksize)
+
+def dps_run(fn, items, chunksize=None, sample=5, progress_cb=None, unit_mb=DPS_UNIT_MB):
+    """Stream a DPS job and keep only a summary: count, first/last `sample` results by index."""
+    cap = dps_unit_cap()
+    try:
+        n = min(len(items), cap)
+    except TypeError:
+        items = list(islice(items, cap))
+        n = len(items)
+    head, tail, done = {}, {}, 0
+    t0 = time.perf_counter()
+    first_s = None
+    for i, res in dps_stream(fn, items, chunksize, unit_mb):
+        if first_s is None:
+            first_s = time.perf_counter() - t0
+        done += 1
+        if i < sample:
+            head[i] = res
+        if i >= n - sample:
+            tail[i] = res
+        if progress_cb:
+            try: progress_cb(done, n)
+            except Exception: pass
+    return {"units": done, "first": [head[i] for i in sorted(head)], "last": [tail[i] for i in sorted(tail)],
+            "first_result_s": round(first_s or 0.0, 4), "seconds": round(time.perf_counter() - t0, 4)}
+
+# --- Shared-memory DPS ---
+# Inputs and outputs live in two shared int64 arrays; workers get only
+# (start, stop) index ranges and write results in place, so no per-item
+# pickling crosses the process boundary.
+DPS_SHM_BLOCK_UNITS = 1 << 20  # most indices per worker task
+
+def _shm_attach(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # the creating process owns the segment; don't let this worker's tracker unlink it
+    try: resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception: pass
+    return shm
+
+def _shm_worker(args):
+    in_name, out_name, start, stop, fn = args
+    src, dst = _shm_attach(in_name), _shm_attach(out_name)
+    try:
+        if np is not None:
+            xs = np.ndarray((stop - start,), dtype=np.int64, buffer=src.buf, offset=start * 8)
+            out = np.ndarray((stop - start,), dtype=np.int64, buffer=dst.buf, offset=start * 8)
+            out[:] = fn(xs)
+            del xs, out
+        else:
+            xs = src.buf.cast("q")
+            out = dst.buf.cast("q")
+            out[start:stop] = array("q", fn(xs[start:stop].tolist()))
+            xs.release()
+            out.release()
+    finally:
+        src.close()
+        dst.close()
+    return stop - start
+
+def shared_map(pool, fn, xs, block=None):
+    """fn over int64 inputs via shared memory; returns an int64 array.
+
+    fn is a batch kernel (sequence in, same-length sequence out, e.g.
+    heavy_compute_batch). Returns a NumPy array when NumPy is available,
+    otherwise array('q').
+    """
+    n = len(xs)
+    if not n:
+        return np.zeros(0, dtype=np.int64) if np is not None else array("q")
+    workers = getattr(pool, "_processes", None) or 1
+    block = block or max(1, min(DPS_SHM_BLOCK_UNITS, math.ceil(n / (workers * 4))))
+    src = shared_memory.SharedMemory(create=True, size=n * 8)
+    dst = shared_memory.SharedMemory(create=True, size=n * 8)
+    try:
+        if np is not None:
+            np.ndarray((n,), dtype=np.int64, buffer=src.buf)[:] = xs
+        else:
+            view = src.buf.cast("q")
+            view[:] = array("q", xs)
+            view.release()
+        jobs = [(src.name, dst.name, a, min(a + block, n), fn) for a in range(0, n, block)]
+        for _ in pool.imap_unordered(_shm_worker, jobs):
+            pass
+        if np is not None:
+            return np.ndarray((n,), dtype=np.int64, buffer=dst.buf).copy()
+        view = dst.buf.cast("q")
+        out = array("q", view)
+        view.release()
+        return out
+    finally:
+        for shm in (src, dst):
+            shm.close()
+            shm.unlink()
+
+def dps_shared_map(fn, xs, block=None):
+    """shared_map on the shared DPS pool, cut to the tier's dps_max_units."""
+    cap = dps_unit_cap()
+    if len(xs) > cap:
+        xs = xs[:cap]
+    return shared_map(get_dps_pool(), fn, xs, block)
+
+# --- DPS task scheduler ---
+DPS_DEFAULT_COST_S = 0.01  # assumed cost of a task submitted without an estimate
+
+def _dps_call(fn, args, kwargs):
+    return fn(*args, **kwargs)
+
+def _dps_call_batch(calls):
+    out = []
+    for fn, args, kwargs in calls:
+        try:
+            out.append((True, fn(*args, **kwargs)))
+        except Exception as e:
+            out.append((False, e))
+    return out
+
+class DpsScheduler:
+    """Submit/future front end for the shared DPS pool.
+
+    Tasks wait in a heap (higher priority first, FIFO within a level).
+    Tasks estimated below DPS_TARGET_BATCH_S are packed into one pool task
+    up to that budget; costlier ones are sent alone. Only about two pool
+    tasks per worker are outstanding at a time, so high-priority work
+    submitted later still goes ahead of queued bulk jobs.
+    """
+    def __init__(self):
+        self._heap = []
+        self._seq = count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self.stats = {"submitted": 0, "solo": 0, "batches": 0, "batched_tasks": 0}
+        self._thread = threading.Thread(target=self._dispatch, name="dps-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, priority=0, cost=None, **kwargs):
+        """Queue fn(*args, **kwargs); fn and its arguments must be picklable."""
+        fut = Future()
+        cost = DPS_DEFAULT_COST_S if cost is None else float(cost)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DPS scheduler is shut down")
+            heapq.heappush(self._heap, (-priority, next(self._seq), cost, fn, args, kwargs, fut))
+            self.stats["submitted"] += 1
+            self._cond.notify_all()
+        return fut
+
+    def map(self, fn, items, priority=0, cost=None):
+        """One future per item, in item order."""
+        return [self.submit(fn, x, priority=priority, cost=cost) for x in items]
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _limit(self):
+        return 2 * max(1, dps_pool_info()["workers"])
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._heap or (not self._closed and self._in_flight >= self._limit()):
+                    if self._closed and not self._heap:
+                        return
+                    self._cond.wait()
+                batch, budget = [], 0.0
+                while self._heap:
+                    cost = self._heap[0][2]
+                    if batch and (cost >= DPS_TARGET_BATCH_S or budget + cost > DPS_TARGET_BATCH_S):
+                        break
+                    fn, args, kwargs, fut = heapq.heappop(self._heap)[3:]
+                    if not fut.set_running_or_notify_cancel():
+                        continue  # cancelled while queued
+                    batch.append((fn, args, kwargs, fut))
+                    budget += cost
+                    if cost >= DPS_TARGET_BATCH_S:
+                        break
+                if not batch:
+                    continue
+                self._in_flight += 1
+                if len(batch) == 1:
+                    self.stats["solo"] += 1
+                else:
+                    self.stats["batches"] += 1
+                    self.stats["batched_tasks"] += len(batch)
+            self._send(batch)
+
+    def _send(self, batch):
+        futs = [b[3] for b in batch]
+        fail = lambda e: self._finish([(False, e)] * len(futs), futs)
+        try:
+            pool = get_dps_pool()
+            if len(batch) == 1:
+                fn, args, kwargs, _ = batch[0]
+                pool.apply_async(_dps_call, (fn, args, kwargs),
+                                 callback=lambda r: self._finish([(True, r)], futs), error_callback=fail)
+            else:
+                pool.apply_async(_dps_call_batch, ([b[:3] for b in batch],),
+                                 callback=lambda r: self._finish(r, futs), error_callback=fail)
+        except Exception as e:
+            fail(e)
+
+    def _finish(self, outcomes, futs):
+        for (ok, value), fut in zip(outcomes, futs):
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; wait=True runs what is queued, otherwise it is cancelled."""
+        with self._cond:
+            self._closed = True
+            if not wait:
+                for item in self._heap:
+                    item[-1].cancel()
+                self._heap.clear()
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+            with self._cond:
+                while self._in_flight:
+                    self._cond.wait()
+
+_DPS_SCHEDULER = None
+_DPS_SCHEDULER_LOCK = threading.Lock()
+
+def get_dps_scheduler():
+    global _DPS_SCHEDULER
+    with _DPS_SCHEDULER_LOCK:
+        if _DPS_SCHEDULER is None:
+            _DPS_SCHEDULER = DpsScheduler()
+        return _DPS_SCHEDULER
+
+def shutdown_dps_scheduler(wait=True):
+    global _DPS_SCHEDULER
+    with _DPS_SCHEDULER_LOCK:
+        sched, _DPS_SCHEDULER = _DPS_SCHEDULER, None
+    if sched is not None:
+        sched.shutdown(wait)
+
+atexit.register(shutdown_dps_scheduler)  # runs before the pool's handler (atexit is LIFO)
+
 def dps_parallel_process():
     print("=== DPS: Parallel Processing Demo ===")
     print("This will simulate distributing work across CPU cores.")
@@ -109,18 +2441,30 @@ def dps_parallel_process():
         n = int(input("How many units of work? (e.g., 50): ").strip() or "50")
     except ValueError:
         n = 50
-    n = min(n, 200)  # safety cap
-    data = list(range(1, n + 1))
-    workers = max(1, min(cpu_count(), 4))  # conservative on mobile
-    print(f"Using {workers} worker processes...")
+    cap = dps_unit_cap()
+    if n > cap:
+        print(f"Your plan allows {cap} units per run; capping.")
+    n = max(1, min(n, cap))
+    engine = input("Engine (batch/scalar, default batch): ").strip().lower() or "batch"
 
-    # Keep this line intact (single line) and ending with colon
-    with Pool(processes=workers) as pool:
-        out = pool.map(heavy_compute, data)
+    get_dps_pool()  # start (or resize) the shared pool; it stays up for the next job
+    print(f"Using {dps_pool_info()['workers']} worker processes...")
+    shown = [0]
+    def progress(done, total):
+        if done - shown[0] >= max(1, total // 10) or done == total:
+            shown[0] = done
+            print(f"Completed {done}/{total} units...")
+    if engine == "scalar":
+        res = dps_run(heavy_compute, range(1, n + 1), progress_cb=progress)
+    else:
+        res = dps_heavy_batched(n, progress_cb=progress)
 
     print("DPS completed. Sample results:")
-    print(f"- First 5 outputs: {out[:5]}")
-    print(f"- Last 5 outputs:  {out[-5:]}")
+    print(f"- First 5 outputs: {res['first']}")
+    print(f"- Last 5 outputs:  {res['last']}")
+    print(f"- First result after {res['first_result_s']}s, all {res['units']} in {res['seconds']}s")
+    if engine == "scalar":
+        print(f"- Memo hit ratio so far: {dps_memo_stats()['hit_ratio']}")
     add_credits(5)
 
 # --- Learning Chatbot (VSTS basics) ---
@@ -192,7 +2536,7 @@ def learning_chatbot():
 def python_terminal():
     print("=== Python Terminal Mode ===")
     print("Enter Python expressions or use commands:")
-    print("Commands: fp (FPS), dp (DPS), help, back")
+    print("Commands: fp (FPS), fb (FPS batch), ft (FPS transform), fh (FPS digest), dp (DPS), help, back")
 
     while True:
         code_line = input("py> ").strip()
@@ -204,12 +2548,24 @@ def python_terminal():
         if low == "help":
             print("Commands:")
             print("- fp : run File Processing System demo")
+            print("- fb : run FPS over a directory or glob")
+            print("- ft : transform a file into a new output file")
+            print("- fh : tree digest of a file, or duplicates in a directory")
             print("- dp : run Distributed Processing demo")
             print("- back : return to menu")
             continue
         if low == "fp":
             fps_chunk_and_process()
             continue
+        if low == "fb":
+            fps_batch_process()
+            continue
+        if low == "ft":
+            fps_transform_process()
+            continue
+        if low == "fh":
+            fps_digest_process()
+            continue
         if low == "dp":
             dps_parallel_process()
             continue
@@ -274,13 +2630,11 @@ def main_menu():
         else:
             print("Invalid choice. Please enter 1-4.")
 
-if __name__ == "__main__":
-    load_state()
-    main_menu()
 # --- Constants (customizable, realistic)
 FREE_ROM_MB, FREE_RAM_MB, FREE_CAP = 500, 256, 25
 BAT_ROM_MB, BAT_RAM_MB, BAT_CAP = 2000, 1024, 100
 PRO_ROM_MB, PRO_RAM_MB, PRO_CAP = 5000, 2048, 200
+FREE_DPS_UNITS, BAT_DPS_UNITS, PRO_DPS_UNITS = 200, 10000, 1000000  # DPS units per run
 
 # --- App state (ensure this merges with your existing state)
 STATE = {
@@ -303,11 +2657,30 @@ STATE = {
 }
 from datetime import datetime, timedelta
 
+# UTC day cache: the date string and the timestamp at which it ends, so the
+# hot paths check for a new day with one float comparison
+_DAY = ["", 0.0]
+_ROLLED_UNTIL = 0.0  # STATE is rolled over up to this timestamp
+
 def _today_str():
-    return datetime.utcnow().strftime("%Y-%m-%d")
+    now = time.time()
+    if now >= _DAY[1]:
+        day = int(now // 86400)
+        _DAY[:] = [time.strftime("%Y-%m-%d", time.gmtime(day * 86400)), (day + 1) * 86400.0]
+    return _DAY[0]
 
 def _ensure_daily_rollover():
-    today = _today_str()
+    global _ROLLED_UNTIL
+    if time.time() < _ROLLED_UNTIL:
+        return
+    with _JOURNAL_LOCK:
+        merge_counters()  # bytes counted so far belong to the day being closed
+        today = _today_str()
+        _rollover_to(today)
+        _ROLLED_UNTIL = _DAY[1]
+
+def _rollover_to(today):
+    # derived from event dates, so replaying the journal repeats it exactly
     last = STATE["usage_counters"]["last_usage_date"]
     if last != today:
         # roll over message counters
@@ -325,17 +2698,19 @@ def _ensure_daily_rollover():
             prev["written"] += ws["bytes_written_today"]
             prev["read"] += ws["bytes_read_today"]
             hist[day] = prev
+            if _LEDGER is not None:
+                _LEDGER.set_day(day, prev["read"], prev["written"])
+                _trim_history(hist)
         ws["bytes_written_today"] = 0
         ws["bytes_read_today"] = 0
-        save_state()
 def set_tier(tier):
     if tier not in ("free", "battery", "pro"):
         return False
-    STATE["tier"] = tier
+    change = {"tier": tier}
     # battery entitlement expiry cleared for pro/free
     if tier != "battery":
-        STATE["contribution"]["entitlement_expires"] = None
-    save_state()
+        change["contribution"] = {"entitlement_expires": None}
+    _record("set", change)
     return True
 
 def get_tier():
@@ -344,50 +2719,143 @@ def get_tier():
     if STATE["tier"] == "battery" and exp:
         try:
             if datetime.utcnow().date() > datetime.fromisoformat(exp).date():
-                STATE["tier"] = "free"
-                STATE["contribution"]["entitlement_expires"] = None
-                save_state()
+                _record("set", {"tier": "free", "contribution": {"entitlement_expires": None}})
         except Exception:
             pass
     return STATE["tier"]
 
 def get_effective_resources():
-    tier = get_tier()
+    return resources_for_tier(get_tier())
+
+def resources_for_tier(tier):
     if tier == "free":
         return {"workspace_cache_mb": FREE_ROM_MB, "processing_memory_mb": FREE_RAM_MB,
-                "cpu_priority": "standard", "daily_cap": FREE_CAP}
+                "cpu_priority": "standard", "daily_cap": FREE_CAP, "dps_max_units": FREE_DPS_UNITS}
     if tier == "battery":
         return {"workspace_cache_mb": BAT_ROM_MB, "processing_memory_mb": BAT_RAM_MB,
-                "cpu_priority": "high", "daily_cap": BAT_CAP}
+                "cpu_priority": "high", "daily_cap": BAT_CAP, "dps_max_units": BAT_DPS_UNITS}
     return {"workspace_cache_mb": PRO_ROM_MB, "processing_memory_mb": PRO_RAM_MB,
-            "cpu_priority": "maximum", "daily_cap": PRO_CAP}
+            "cpu_priority": "maximum", "daily_cap": PRO_CAP, "dps_max_units": PRO_DPS_UNITS}
+
+# How each cpu_priority level runs DPS workers: process count, nice increment
+# and how many cores they are pinned to (None = every core / no pinning)
+CPU_PRIORITY_PROFILES = {
+    "standard": {"workers": 2, "nice": 10, "cores": 2},
+    "high": {"workers": 4, "nice": 5, "cores": 4},
+    "maximum": {"workers": None, "nice": 0, "cores": None},
+}
+DPS_WORKER_MB = 64  # rough resident cost of one worker process
+
+def cpu_profile(priority=None):
+    if priority is None:
+        priority = get_effective_resources()["cpu_priority"]
+    return CPU_PRIORITY_PROFILES.get(priority, {"workers": 1, "nice": 10, "cores": 1})
+
+def _allowed_cores():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return list(range(cpu_count()))
+
+def workers_for_priority(priority=None, ram_mb=None):
+    """Worker processes for a priority level, also bounded by the RAM budget."""
+    prof = cpu_profile(priority)
+    if ram_mb is None:
+        ram_mb = get_effective_resources()["processing_memory_mb"]
+    n = len(_allowed_cores())
+    if prof["cores"] is not None:
+        n = min(n, prof["cores"])
+    if prof["workers"] is not None:
+        n = min(n, prof["workers"])
+    return max(1, min(n, ram_mb // DPS_WORKER_MB))
 def increment_messages_used():
-    _ensure_daily_rollover()
-    cap = get_effective_resources()["daily_cap"]
-    used = STATE["usage_counters"]["messages_used_today"]
-    if used >= cap:
-        return False
-    STATE["usage_counters"]["messages_used_today"] = used + 1
-    save_state()
+    with _JOURNAL_LOCK:
+        _ensure_daily_rollover()
+        cap = get_effective_resources()["daily_cap"]
+        used = STATE["usage_counters"]["messages_used_today"]
+        if used >= cap:
+            return False
+        _record("msg", 1)
     return True
 
+# --- Usage counters ---
+# Byte counters go into a per-thread accumulator that only its thread writes.
+# merge_counters() adds each one's growth since the last merge to STATE (one
+# journal event per field); it runs on reads, flushes, the day boundary, and
+# from each thread every COUNTER_MERGE_S. Messages stay exact under the lock.
+COUNTER_MERGE_S = 0.25
+_COUNTERS = []
+_COUNTER_LOCAL = threading.local()
+
+class _ThreadCounter:
+    __slots__ = ("read", "written", "merged_read", "merged_written", "next_merge", "thread")
+
+    def __init__(self):
+        self.read = self.written = self.merged_read = self.merged_written = 0
+        self.next_merge = time.time() + COUNTER_MERGE_S
+        self.thread = threading.current_thread()
+
+def _thread_counter():
+    try:
+        return _COUNTER_LOCAL.c
+    except AttributeError:
+        c = _COUNTER_LOCAL.c = _ThreadCounter()
+        with _JOURNAL_LOCK:
+            _COUNTERS.append(c)
+        return c
+
+def merge_counters():
+    """Fold every thread's pending byte counts into STATE."""
+    with _JOURNAL_LOCK:
+        rd = wr = 0
+        live = []
+        for c in _COUNTERS:
+            alive = c.thread.is_alive()  # checked first: a dead thread's totals are final
+            r, w = c.read, c.written
+            rd += r - c.merged_read
+            wr += w - c.merged_written
+            c.merged_read, c.merged_written = r, w
+            if alive:
+                live.append(c)
+        _COUNTERS[:] = live
+        day = STATE["usage_counters"]["last_usage_date"] or _today_str()
+        if rd:
+            _record("read", rd, day)
+        if wr:
+            _record("write", wr, day)
+
 def workspace_write(n_bytes):
-    _ensure_daily_rollover()
-    STATE["workspace"]["bytes_written_today"] += int(n_bytes)
-    save_state()
+    now = time.time()
+    if now >= _ROLLED_UNTIL:
+        _ensure_daily_rollover()
+    _io_recorded("write", n_bytes)
+    c = _thread_counter()
+    c.written += int(n_bytes)
+    if now >= c.next_merge:
+        c.next_merge = now + COUNTER_MERGE_S
+        merge_counters()
 
 def workspace_read(n_bytes):
-    _ensure_daily_rollover()
-    STATE["workspace"]["bytes_read_today"] += int(n_bytes)
-    save_state()
+    now = time.time()
+    if now >= _ROLLED_UNTIL:
+        _ensure_daily_rollover()
+    _io_recorded("read", n_bytes)
+    c = _thread_counter()
+    c.read += int(n_bytes)
+    if now >= c.next_merge:
+        c.next_merge = now + COUNTER_MERGE_S
+        merge_counters()
 
 def get_mb_today():
+    merge_counters()
     wr = STATE["workspace"]["bytes_written_today"] / (1024*1024)
     rd = STATE["workspace"]["bytes_read_today"] / (1024*1024)
     return round(wr, 2), round(rd, 2)
 
 def get_last_7_days_mb():
     # returns list of tuples (date, read_mb, written_mb), most-recent first up to 7 days
+    if _LEDGER is not None:
+        return [(d, round(rd/(1024*1024), 2), round(wr/(1024*1024), 2)) for d, rd, wr in _LEDGER.last_days(7)]
     hist = STATE["workspace"]["daily_history"]
     dates = sorted(hist.keys(), reverse=True)
     out = []
@@ -396,21 +2864,65 @@ def get_last_7_days_mb():
         wr = hist[d].get("written", 0)/(1024*1024)
         out.append((d, round(rd,2), round(wr,2)))
     return out
+# --- Usage ledger (optional SQLite history) ---
+# With the ledger on, every rolled-over day is stored there and STATE keeps
+# only the latest USAGE_HISTORY_KEEP_DAYS, so the state file stops growing.
+USAGE_LEDGER_DB = "usage_ledger.sqlite"
+USAGE_HISTORY_KEEP_DAYS = 7
+_LEDGER = None
+
+def _trim_history(hist):
+    for d in sorted(hist)[:-USAGE_HISTORY_KEEP_DAYS]:
+        del hist[d]
+
+def enable_usage_ledger(path=USAGE_LEDGER_DB, retention_days=None):
+    """Keep usage history in SQLite (lde_ledger); existing history is imported.
+
+    retention_days may not be below USAGE_HISTORY_KEEP_DAYS, the days STATE keeps anyway.
+    """
+    global _LEDGER
+    if retention_days and retention_days < USAGE_HISTORY_KEEP_DAYS:
+        raise ValueError(f"retention_days must be at least {USAGE_HISTORY_KEEP_DAYS}")
+    import lde_ledger
+    ledger = lde_ledger.UsageLedger(path)
+    with _JOURNAL_LOCK:
+        ledger.import_history(STATE["workspace"]["daily_history"])
+        if retention_days:
+            ledger.apply_retention(retention_days)
+        old, _LEDGER = _LEDGER, ledger
+    if old is not None:
+        old.close()
+    return ledger
+
+def usage_ledger():
+    return _LEDGER
+
+def get_usage_between(start, end):
+    """[(date, read_mb, written_mb)] for dates in [start, end], oldest first."""
+    if _LEDGER is not None:
+        rows = _LEDGER.between(start, end)
+    else:
+        hist = STATE["workspace"]["daily_history"]
+        rows = [(d, hist[d].get("read", 0), hist[d].get("written", 0)) for d in sorted(hist) if start <= d <= end]
+    return [(d, round(rd/(1024*1024), 2), round(wr/(1024*1024), 2)) for d, rd, wr in rows]
 def simulate_battery_contribution(percent):
     # percent contributed for today; if >=15, count it
-    _ensure_daily_rollover()
+    with _JOURNAL_LOCK:
+        _ensure_daily_rollover()
+        c = dict(STATE["contribution"])
+        change = {"contribution": c}
+        c["battery_share_percent"] = int(percent)
+        if percent >= 15:
+            c["contrib_days"] = int(c["contrib_days"]) + 1
+        # grant battery plan if 7+ contributing days and not already active
+        if c["contrib_days"] >= 7:
+            change["tier"] = "battery"
+            expiry = (datetime.utcnow() + timedelta(days=7)).date().isoformat()
+            c["entitlement_expires"] = expiry
+            # reset counter for next cycle
+            c["contrib_days"] = 0
+        _record("set", change)
     c = STATE["contribution"]
-    c["battery_share_percent"] = int(percent)
-    if percent >= 15:
-        c["contrib_days"] = int(c["contrib_days"]) + 1
-    # grant battery plan if 7+ contributing days and not already active
-    if c["contrib_days"] >= 7:
-        STATE["tier"] = "battery"
-        expiry = (datetime.utcnow() + timedelta(days=7)).date().isoformat()
-        c["entitlement_expires"] = expiry
-        # reset counter for next cycle
-        c["contrib_days"] = 0
-    save_state()
     return {
         "tier": STATE["tier"],
         "battery_share_percent": c["battery_share_percent"],
@@ -429,13 +2941,16 @@ def process_data_service():
     workspace_read(bytes_read)
     add_credits(3)
     return {"items": len(items), "avg": round(avg, 2), "bytes_mb": round(bytes_read/(1024*1024), 2)}
-def stress_compute(iterations=200000, steps=10, progress_cb=None):
-    # simple CPU loop broken into steps
+def stress_compute(iterations=200000, steps=10, progress_cb=None, vectorized=False):
+    # simple CPU loop broken into steps (vectorized=True uses the closed form)
     chunk = max(1, iterations//steps)
     acc = 0
     for i in range(steps):
-        for j in range(chunk):
-            acc = (acc + j) % 1000003
+        if vectorized:
+            acc = stress_accumulate(chunk * (i + 1), i + 1)
+        else:
+            for j in range(chunk):
+                acc = (acc + j) % 1000003
         if progress_cb:
             try: progress_cb(i+1, steps)
             except Exception: pass
@@ -495,15 +3010,24 @@ _QA = {
     }
 }
 
-def explainer_answer(style, question):
+def explainer_answer(style, question, count_message=None, credit=True):
+    """Answer from _QA if the daily message cap allows it.
+
+    count_message checks and counts the message (the local user's cap by
+    default; the metering service passes an account's). credit=False skips
+    the local user's credit, for questions asked on behalf of an account.
+    """
     style = (style or "simple").strip().lower()
     q = (question or "").strip().lower()
-    if not increment_messages_used():
+    if not (count_message or increment_messages_used)():
         return "Daily cap reached for your current plan. Upgrade or contribute battery to increase the cap."
     entry = _QA.get(q)
-    if not entry:
+    if credit:
         add_credits(1)
+    if not entry:
         return "Answer not in local knowledge yet. Try another topic."
-    msg = entry.get(style) or entry.get("simple")
-    add_credits(1)
-    return msg
+    return entry.get(style) or entry.get("simple")
+
+if __name__ == "__main__":
+    load_state()
+    main_menu()
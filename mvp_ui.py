@@ -513,14 +513,18 @@ class MVPApp(MDApp):
             exp = core.STATE["contribution"].get("entitlement_expires")
             used = core.STATE["usage_counters"]["messages_used_today"]
             cap = res["daily_cap"]
+            io = core.get_io_allowance()
             return {
                 "tier": tier, "expiry": exp or "-",
                 "used": used, "remaining": max(0, cap - used),
                 "rom": res["workspace_cache_mb"], "ram": res["processing_memory_mb"],
-                "cpu": res["cpu_priority"], "read_mb": rd_mb, "write_mb": wr_mb
+                "cpu": res["cpu_priority"], "read_mb": rd_mb, "write_mb": wr_mb,
+                "io_read_mbps": io["read"]["rate_mbps"], "io_write_mbps": io["write"]["rate_mbps"],
+                "io_read_left_mb": io["read"]["left_mb"], "io_write_left_mb": io["write"]["left_mb"]
             }
         except Exception:
-            return {"tier":"free","expiry":"-","used":0,"remaining":0,"rom":0,"ram":0,"cpu":"-","read_mb":0,"write_mb":0}
+            return {"tier":"free","expiry":"-","used":0,"remaining":0,"rom":0,"ram":0,"cpu":"-","read_mb":0,"write_mb":0,
+                    "io_read_mbps":0,"io_write_mbps":0,"io_read_left_mb":0,"io_write_left_mb":0}
 
     def learning_update_dashboard(self):
         try:
@@ -529,7 +533,8 @@ class MVPApp(MDApp):
             scr.ids.learn_msg_stats.text = f"Messages: {m['used']} used, {m['remaining']} remaining"
             scr.ids.learn_power_stats.text = f"Plan: {m['tier']} (exp: {m['expiry']})"
             if scr.ids.get("learn_rom_label"):
-                scr.ids.learn_rom_label.text = f"Virtual ROM: {m['read_mb']} MB read today / {m['rom']} MB"
+                scr.ids.learn_rom_label.text = (f"Virtual ROM: {m['read_mb']} MB read today / {m['rom']} MB"
+                                                f" (I/O {m['io_read_mbps']} MB/s read, {m['io_read_left_mb']} MB left)")
             if scr.ids.get("learn_ram_label"):
                 scr.ids.learn_ram_label.text = f"Virtual RAM: {m['ram']} MB reserved"
             if scr.ids.get("learn_cpu_label"):
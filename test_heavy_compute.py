@@ -0,0 +1,31 @@
+# test_heavy_compute.py
+# The batch engine's closed forms must give exactly what the loops give.
+import pytest
+import mvp_core as core
+
+INPUTS = (list(range(-100, 101)) + [core.HEAVY_MOD - 1, core.HEAVY_MOD, core.HEAVY_MOD + 1,
+          -core.HEAVY_MOD, 2**31, 2**62, 2**63 - 1, -2**63, 12345678901234])
+BIG = [2**63, 2**70, -2**63 - 1, -2**90 + 7, 10**30]
+BACKENDS = ["python", pytest.param("numpy", marks=pytest.mark.skipif(core.np is None, reason="numpy not installed"))]
+
+def test_fast_matches_loop():
+    for x in INPUTS + BIG:
+        assert core.heavy_compute_fast(x) == core.heavy_compute(x), x
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_batch_matches_loop(backend):
+    want = [core.heavy_compute(x) for x in INPUTS]
+    assert [int(v) for v in core.heavy_compute_batch(INPUTS, backend=backend)] == want
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_batch_above_int64_matches_loop(backend):
+    xs = INPUTS[:20] + BIG
+    want = [core.heavy_compute(x) for x in xs]
+    assert [int(v) for v in core.heavy_compute_batch(xs, backend=backend)] == want
+
+@pytest.mark.parametrize("iterations,steps", [(1, 1), (10, 3), (9, 10), (1000, 7), (200000, 10)])
+def test_stress_accumulate_matches_loop(monkeypatch, iterations, steps):
+    monkeypatch.setattr(core, "workspace_write", lambda n: None)  # keep the app state untouched
+    loop = core.stress_compute(iterations, steps)["acc"]
+    assert core.stress_compute(iterations, steps, vectorized=True)["acc"] == loop
+    assert core.stress_accumulate(max(1, iterations // steps) * steps, steps) == loop